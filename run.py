@@ -5,11 +5,8 @@ from ui.MainWindow import Ui_ProcesorySygnaowe
 from src.ui_methods import UiMethods
 
 
-def main():
-
-    app = QtWidgets.QApplication(sys.argv)
-
-    settings = pipeline_settings()
+def create_window(settings: pipeline_settings) -> tuple:
+    """Builds main window and connects its widgets, GStreamer is not loaded yet"""
 
     main_window = QtWidgets.QMainWindow()
     ui = Ui_ProcesorySygnaowe()
@@ -22,6 +19,13 @@ def main():
     ui.OpenFile.clicked.connect(lambda: methods.select_input_file())
     ui.Run.clicked.connect(lambda: methods.run_pipeline())
     ui.SaveFile.clicked.connect(lambda: methods.save_output())
+    methods.cancel.clicked.connect(lambda: methods.cancel_pipeline())
+    methods.preview.clicked.connect(lambda: methods.preview_pipeline())
+    methods.load_preset_action.triggered.connect(lambda: methods.load_preset())
+    methods.save_preset_action.triggered.connect(lambda: methods.save_preset())
+    methods.play_original.clicked.connect(lambda: methods.audition(False))
+    methods.play_processed.clicked.connect(lambda: methods.audition(True))
+    methods.stop_playing.clicked.connect(lambda: methods.player.stop())
     # HighPass
     ui.enable_HighPass.stateChanged.connect(lambda: methods.update_highpass_settings())
     ui.highpass_cutoff.valueChanged.connect(lambda: methods.update_highpass_settings())
@@ -93,7 +97,18 @@ def main():
         lambda: methods.update_equalizer_settings()
     )
 
+    return main_window, methods
+
+
+def main():
+
+    app = QtWidgets.QApplication(sys.argv)
+
+    settings = pipeline_settings()
+
+    main_window, methods = create_window(settings)
     main_window.show()
+    methods.warm_up()
 
     return app.exec_()
 
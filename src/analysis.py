@@ -0,0 +1,123 @@
+import json
+import numpy as np
+
+
+class LevelAnalyzer:
+    """Peak, RMS and per band energy of the audio passing one pad
+
+    Runs in the streaming thread on every buffer, so input and output are
+    measured in the same pass as processing. Bands are spaced
+    logarithmically from 20 Hz to half the sample rate, bands narrower than
+    the FFT bins of short buffers may stay empty.
+    """
+
+    def __init__(self, bands: int = 32, dtype=np.float32) -> None:
+        self.bands = bands
+        self.dtype = dtype
+        self.reset()
+
+    def reset(self) -> None:
+        """Zeroes collected values, attached probes stay in place"""
+        # Read from caps of the first buffer, the next file may differ
+        self.rate = 0
+        self.channels = 0
+        self.frames = 0
+        self.peak = None
+        self.square = None
+        self.energy = np.zeros(self.bands)
+        # Buffer length -> band of every FFT bin, -1 below 20 Hz
+        self._bands = {}
+
+    def attach(self, pad) -> None:
+        """Adds buffer probe to pad"""
+        from gi.repository import Gst
+
+        pad.add_probe(Gst.PadProbeType.BUFFER, self._on_buffer)
+
+    def _on_buffer(self, pad, info):
+        from gi.repository import Gst
+
+        if not self.rate:
+            structure = pad.get_current_caps().get_structure(0)
+            _, self.rate = structure.get_int("rate")
+            _, self.channels = structure.get_int("channels")
+        buffer = info.get_buffer()
+        ok, mapped = buffer.map(Gst.MapFlags.READ)
+        if ok:
+            try:
+                samples = np.frombuffer(mapped.data, dtype=self.dtype)
+                self.add(samples.reshape(-1, self.channels))
+            finally:
+                buffer.unmap(mapped)
+        return Gst.PadProbeReturn.OK
+
+    def edges(self) -> np.ndarray:
+        """Returns band edges in Hz, bands + 1 values, none before any buffer"""
+        if not self.rate:
+            return np.zeros(0)
+        return np.geomspace(20.0, self.rate / 2, self.bands + 1)
+
+    def _band_index(self, frames: int) -> np.ndarray:
+        if frames not in self._bands:
+            bins = np.fft.rfftfreq(frames, 1 / self.rate)
+            index = np.searchsorted(self.edges(), bins, side="right") - 1
+            # Nyquist bin sits on the last edge
+            self._bands[frames] = np.minimum(index, self.bands - 1)
+        return self._bands[frames]
+
+    def add(self, samples: np.ndarray) -> None:
+        """Adds block of samples [frames, channels]"""
+        if not len(samples):
+            return
+        samples = samples.astype(np.float64)
+        peak = np.abs(samples).max(axis=0)
+        square = np.square(samples).sum(axis=0)
+        if self.peak is None:
+            self.peak, self.square = peak, square
+        else:
+            self.peak = np.maximum(self.peak, peak)
+            self.square += square
+
+        # Parseval scaling, band energies sum to the block's energy
+        power = np.square(np.abs(np.fft.rfft(samples, axis=0))).sum(axis=1)
+        power /= len(samples)
+        # One sided spectrum, bins other than DC and Nyquist count twice
+        power[1:] *= 2
+        if len(samples) % 2 == 0:
+            power[-1] /= 2
+        index = self._band_index(len(samples))
+        valid = index >= 0
+        self.energy += np.bincount(index[valid], power[valid], self.bands)
+        self.frames += len(samples)
+
+    def to_dict(self) -> dict:
+        """Returns levels in dBFS, per channel peak/RMS and mean power per band"""
+        if not self.frames:
+            return {"frames": 0}
+        rms = np.sqrt(self.square / self.frames)
+        power = self.energy / (self.frames * self.channels)
+        with np.errstate(divide="ignore"):
+            return {
+                "frames": self.frames,
+                "peak": _db(20 * np.log10(self.peak)),
+                "rms": _db(20 * np.log10(rms)),
+                "bands": _db(10 * np.log10(power)),
+            }
+
+
+def _db(values: np.ndarray) -> list:
+    """Rounds to 0.01 dB, silence is reported as None (JSON null)"""
+    return [round(float(each), 2) if np.isfinite(each) else None for each in values]
+
+
+def write_sidecar(path: str, before: LevelAnalyzer, after: LevelAnalyzer) -> None:
+    """Writes input and output measurements as JSON"""
+    report = {
+        "rate": after.rate,
+        "channels": after.channels,
+        "band_edges": [round(float(each), 1) for each in after.edges()],
+        "input": before.to_dict(),
+        "output": after.to_dict(),
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, separators=(",", ":"))
@@ -0,0 +1,368 @@
+import argparse
+import copy
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from src.settings import pipeline_settings, load_settings
+from src.metrics import merge, prometheus
+from src.cache import RenderCache
+from src.files import place_file
+
+
+# Settings shared by every job of a worker, set by _init_worker
+_settings = None
+# "gstreamer" or "numpy", set by _init_worker
+_engine = "gstreamer"
+# Collect per stage metrics, gstreamer engine only
+_metrics = False
+# RenderCache shared through its directory, None when disabled
+_cache = None
+# Pipeline reused by every job of a worker
+_pipeline = None
+
+# Files written next to inputs and outputs, see src.peaks and src.analysis
+SIDECARS = (".peaks.npz", ".partial.npz", ".analysis.json")
+
+
+def expand_inputs(patterns: list) -> list:
+    """Expands directories and glob patterns into a sorted list of files
+
+    Sidecars of this tool found by expansion are skipped, files named
+    explicitly are always kept.
+    """
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            files.extend(
+                os.path.join(pattern, name)
+                for name in os.listdir(pattern)
+                if os.path.isfile(os.path.join(pattern, name))
+                and not name.endswith(SIDECARS)
+            )
+        elif glob.has_magic(pattern):
+            files.extend(
+                each
+                for each in glob.glob(pattern, recursive=True)
+                if not each.endswith(SIDECARS)
+            )
+        else:
+            files.append(pattern)
+    return sorted(set(files))
+
+
+def output_path(
+    input_file: str, output_dir: str, extension: str = ".wav", root: str = None
+) -> str:
+    """Returns output location for given input file
+
+    Subdirectories below root are kept, so equal names in different
+    directories do not overwrite each other.
+    """
+    root = root or os.path.dirname(input_file)
+    relative = os.path.relpath(os.path.abspath(input_file), os.path.abspath(root))
+    name, _ = os.path.splitext(relative)
+    return os.path.join(output_dir, f"{name}{extension}")
+
+
+def output_paths(files: list, output_dir: str, extension: str) -> list:
+    """Returns (input, output) pairs, exits if two inputs share an output"""
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in files])
+    work = [(each, output_path(each, output_dir, extension, root)) for each in files]
+    seen = {}
+    for input_file, output_file in work:
+        if output_file in seen:
+            raise SystemExit(
+                f"Error: {seen[output_file]} and {input_file} both write {output_file}"
+            )
+        seen[output_file] = input_file
+    return work
+
+
+def _init_worker(
+    settings: pipeline_settings,
+    engine: str,
+    coefficient_dir: str,
+    metrics: bool,
+    cache_dir: str,
+) -> None:
+    """Pool initializer, every worker process gets its own copy of settings"""
+    global _settings, _engine, _metrics, _cache
+    _settings = settings
+    _engine = engine
+    _metrics = metrics and engine == "gstreamer"
+    _cache = RenderCache(cache_dir) if cache_dir else None
+
+    if engine == "numpy":
+        from src.dsp import coefficients
+
+        coefficients.path = coefficient_dir
+
+
+def _result(input_file: str, output_file: str, **values) -> dict:
+    """Returns result of one file, values override those of an unprocessed file"""
+    result = {
+        "input": input_file,
+        "output": output_file,
+        "wall": 0.0,
+        "audio": 0.0,
+        "error": None,
+        "reused": False,
+        "cached": False,
+        "fused": 0,
+        "conversions": [],
+        "cache_hits": 0,
+        "cache_misses": 0,
+        "metrics": None,
+        "bytes": 0,
+        "encode_time": 0.0,
+        # Largest allocations in bytes, GStreamer engine only
+        "memory_bound": None,
+    }
+    result.update(values)
+    return result
+
+
+def _process(job: tuple) -> dict:
+    """Runs a single file through the pipeline inside a worker process"""
+    input_file, output_file = job
+    try:
+        return _render(input_file, output_file)
+    except OSError as e:
+        # Missing or unreadable input fails this file, not the whole batch
+        return _result(input_file, output_file, error=str(e))
+    except SystemExit as e:
+        # Pool workers never send back BaseException, the batch would hang
+        return _result(input_file, output_file, error=str(e))
+
+
+def _render(input_file: str, output_file: str) -> dict:
+    # Imported here so every worker runs its own Gst.init
+    if _engine == "numpy":
+        from src.dsp import Engine as Pipeline, coefficients
+    else:
+        from src.pipeline import Pipeline
+
+        coefficients = None
+
+    global _pipeline
+    cached = (coefficients.hits, coefficients.misses) if coefficients else (0, 0)
+
+    start = time.perf_counter()
+    key = None
+    if _cache:
+        settings = copy.deepcopy(_settings)
+        settings.input_file = input_file
+        key = _cache.key(settings, _engine)
+        entry = _cache.get(key)
+        if entry:
+            place_file(entry, output_file)
+            return _result(
+                input_file,
+                output_file,
+                wall=time.perf_counter() - start,
+                cached=True,
+                bytes=os.path.getsize(output_file),
+            )
+        # Never write through a hard link into the cache
+        if os.path.exists(output_file):
+            os.remove(output_file)
+
+    reused = _pipeline is not None
+    if reused:
+        _pipeline.reset(input_file, output_file)
+    else:
+        settings = copy.deepcopy(_settings)
+        settings.input_file = input_file
+        settings.output_file = output_file
+        if _metrics:
+            _pipeline = Pipeline(settings, metrics=True)
+        else:
+            _pipeline = Pipeline(settings)
+    _pipeline.run()
+    wall = time.perf_counter() - start
+    report = _pipeline.output_report()
+    if key and not _pipeline.error:
+        _cache.put(key, output_file)
+
+    return _result(
+        input_file,
+        output_file,
+        wall=wall,
+        audio=_pipeline.duration / 1e9,
+        error=str(_pipeline.error) if _pipeline.error else None,
+        reused=reused,
+        fused=getattr(_pipeline, "fused", 0),
+        conversions=getattr(_pipeline, "conversions", []),
+        cache_hits=coefficients.hits - cached[0] if coefficients else 0,
+        cache_misses=coefficients.misses - cached[1] if coefficients else 0,
+        metrics=_pipeline.metrics.to_dict() if _metrics else None,
+        bytes=report["bytes"],
+        encode_time=report["encode_time"],
+        memory_bound=(
+            _pipeline.memory_bound() if hasattr(_pipeline, "memory_bound") else None
+        ),
+    )
+
+
+def check_settings(settings: pipeline_settings, engine: str) -> None:
+    """Exits before any worker starts when no file could be processed"""
+    try:
+        settings.validate()
+    except ValueError as e:
+        raise SystemExit(f"Error: {e}")
+    if not any(getattr(settings, each).enabled for each in settings.filters):
+        raise SystemExit("Error: No elements were created")
+    if engine == "numpy" and settings.output.encoder not in ("wav", "raw"):
+        raise SystemExit(f"Error: {settings.output.encoder} output needs GStreamer")
+    if settings.processing.format != "F32LE" and settings.karaoke.enabled:
+        raise SystemExit("Error: audiokaraoke needs F32LE processing format")
+
+
+def run_batch(
+    settings: pipeline_settings,
+    files: list,
+    output_dir: str,
+    jobs: int,
+    engine: str = "gstreamer",
+    coefficient_dir: str = None,
+    metrics_file: str = None,
+    cache_dir: str = None,
+) -> list:
+    """Processes files using a pool of worker processes and prints a report"""
+    check_settings(settings, engine)
+    if engine == "gstreamer":
+        # Missing plugins fail once here, not in every worker after a decode
+        from src.pipeline import preflight
+
+        preflight(settings)
+    if cache_dir and settings.analysis.enabled:
+        # A cache hit runs no pipeline and would leave the file without sidecar
+        print("Render cache is not used with analysis enabled")
+        cache_dir = None
+    work = output_paths(files, output_dir, settings.output.extension)
+    for directory in {os.path.dirname(output) for _, output in work}:
+        os.makedirs(directory, exist_ok=True)
+
+    # Spawn, so GStreamer and GLib state is never shared through fork
+    context = multiprocessing.get_context("spawn")
+    results = []
+    start = time.perf_counter()
+    with context.Pool(
+        jobs,
+        initializer=_init_worker,
+        initargs=(settings, engine, coefficient_dir, bool(metrics_file), cache_dir),
+    ) as pool:
+        for result in pool.imap_unordered(_process, work):
+            results.append(result)
+            if result["error"]:
+                print(f"FAILED {result['input']}: {result['error']}")
+            elif result["cached"]:
+                print(f"{result['input']}: cached")
+            else:
+                print(
+                    f"{result['input']}: {result['wall']:.2f}s wall, "
+                    f"{result['audio']:.2f}s audio, {result['bytes']} bytes, "
+                    f"{result['encode_time']:.2f}s encoding"
+                )
+                for each in result["conversions"]:
+                    print(f"  {each['element']}: {each['from']} -> {each['to']}")
+    wall = time.perf_counter() - start
+
+    failed = sum(1 for each in results if each["error"])
+    audio = sum(each["audio"] for each in results if not each["error"])
+    reused = sum(1 for each in results if each["reused"])
+    cached = sum(1 for each in results if each["cached"])
+    print(f"Processed {len(results) - failed}/{len(results)} files in {wall:.2f}s")
+    if cached:
+        print(f"Served from render cache: {cached}")
+    written = sum(each["bytes"] for each in results)
+    encoding = sum(each["encode_time"] for each in results)
+    print(
+        f"Written {written} bytes ({settings.output.encoder}), "
+        f"{encoding:.2f}s encoding"
+    )
+    print(f"Pipeline rebuilds avoided: {reused}")
+    bounds = [each["memory_bound"] for each in results if each["memory_bound"]]
+    if bounds:
+        largest = {name: max(each[name] for each in bounds) for name in bounds[0]}
+        sizes = [f"{name} {size / 1024 ** 2:.1f} MiB" for name, size in largest.items()]
+        print(f"Memory bound per worker: {', '.join(sizes)}")
+    if any(each["fused"] for each in results):
+        print(f"Filter stages fused: {max(each['fused'] for each in results)}")
+    if engine == "numpy":
+        hits = sum(each["cache_hits"] for each in results)
+        misses = sum(each["cache_misses"] for each in results)
+        print(f"Coefficient cache: {hits} hits, {misses} misses")
+    if wall > 0:
+        print(f"Throughput: {audio / wall:.2f} audio-seconds per second")
+
+    if metrics_file:
+        report = merge([each["metrics"] for each in results if each["metrics"]])
+        with open(metrics_file, "w") as f:
+            if metrics_file.endswith(".prom"):
+                f.write(prometheus(report))
+            else:
+                json.dump(report, f, indent=2)
+        print(f"Metrics saved to {metrics_file}")
+    return results
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Runs many files through the pipeline without the GUI"
+    )
+    parser.add_argument("settings", help="JSON or TOML preset")
+    parser.add_argument("inputs", nargs="+", help="Input files, directories or globs")
+    parser.add_argument("-o", "--output-dir", default="out", help="Output directory")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count(), help="Worker processes"
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        choices=("gstreamer", "numpy"),
+        default="gstreamer",
+        help="numpy skips GStreamer entirely, WAV input only",
+    )
+    parser.add_argument(
+        "--coefficient-cache", help="Directory keeping designed filters between runs"
+    )
+    parser.add_argument(
+        "--metrics",
+        help="Per stage metrics file, Prometheus text if it ends with .prom",
+    )
+    parser.add_argument(
+        "--cache",
+        help="Render cache directory, unchanged files are not processed again",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        settings = load_settings(args.settings)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    files = expand_inputs(args.inputs)
+    if not files:
+        print("Error: No input files found")
+        return 1
+
+    results = run_batch(
+        settings,
+        files,
+        args.output_dir,
+        max(1, args.jobs),
+        args.engine,
+        args.coefficient_cache,
+        args.metrics,
+        args.cache,
+    )
+    return 1 if any(each["error"] for each in results) else 0
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
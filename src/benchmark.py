@@ -0,0 +1,346 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import wave
+import numpy as np
+from src.settings import pipeline_settings
+
+
+STAGES = ("highpass", "lowpass", "echo", "equalizer", "karaoke")
+
+# Runs in a fresh interpreter, times are in seconds from its first line
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from PyQt5 import QtWidgets
+import run
+from src.settings import pipeline_settings
+imported = time.perf_counter()
+app = QtWidgets.QApplication([])
+window, methods = run.create_window(pipeline_settings())
+window.show()
+app.processEvents()
+shown = time.perf_counter()
+early = "gi" in sys.modules
+import src.pipeline
+print(json.dumps({
+    "imports": imported - start,
+    "window_shown": shown - start,
+    "gstreamer_load": time.perf_counter() - shown,
+    "gstreamer_before_window": early,
+}))
+"""
+
+
+def synthetic_input(
+    path: str, seconds: float, rate: int = 44100, channels: int = 2
+) -> str:
+    """Writes white noise 16-bit WAV file used when no input is given"""
+    frames = int(seconds * rate)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        # Random bytes are valid full scale noise for 16-bit samples
+        for _ in range(0, frames, rate):
+            f.writeframes(os.urandom(min(rate, frames - f.tell()) * channels * 2))
+    return path
+
+
+def benchmark_settings(
+    stages: tuple, input_file: str, output_file: str
+) -> pipeline_settings:
+    """Returns settings with given stages enabled, using values that do real work"""
+    settings = pipeline_settings()
+    settings.input_file = input_file
+    settings.output_file = output_file
+
+    settings.highpass.cutoff = 200.0
+    settings.lowpass.cutoff = 5000.0
+    settings.echo.delay = 250000000
+    settings.echo.max_delay = 500000000
+    settings.echo.feedback = 0.3
+    settings.echo.intensity = 0.5
+    settings.equalizer.bands = [-6.0, -3.0, 0.0, 3.0, 6.0, 6.0, 3.0, 0.0, -3.0, -6.0]
+    # Not the defaults, --compare has to see both scale the mono signal
+    settings.karaoke.level = 0.8
+    settings.karaoke.mono_level = 0.6
+
+    for stage in stages:
+        getattr(settings, stage).enabled = True
+    return settings
+
+
+def _measure(settings: pipeline_settings) -> dict:
+    """Runs single benchmark inside a fresh process so peak RSS is its own"""
+    from src.pipeline import Pipeline
+
+    start = time.perf_counter()
+    try:
+        pipeline = Pipeline(settings)
+    except SystemExit as e:
+        # Pool workers never send back BaseException, apply() would hang
+        return {
+            "wall": 0.0,
+            "audio": 0.0,
+            "rate": 0,
+            "channels": 0,
+            "peak_rss_kb": 0,
+            "error": str(e),
+        }
+    pipeline.run()
+    wall = time.perf_counter() - start
+    pipeline.kill()
+
+    return {
+        "wall": wall,
+        "audio": pipeline.duration / 1e9,
+        "rate": pipeline.rate,
+        "channels": pipeline.channels,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "error": str(pipeline.error) if pipeline.error else None,
+    }
+
+
+def run_benchmark(input_file: str, output_file: str, combinations: list) -> list:
+    """Measures every combination of stages, prints and returns results"""
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for stages in combinations:
+        settings = benchmark_settings(stages, input_file, output_file)
+        with context.Pool(1) as pool:
+            measured = pool.apply(_measure, (settings,))
+
+        result = {"stages": list(stages), **measured}
+        if measured["wall"] > 0:
+            result["realtime_factor"] = measured["audio"] / measured["wall"]
+            result["samples_per_second"] = (
+                measured["audio"]
+                * measured["rate"]
+                * measured["channels"]
+                / measured["wall"]
+            )
+        results.append(result)
+
+        name = "+".join(stages)
+        if measured["error"]:
+            print(f"{name:<45} FAILED: {measured['error']}")
+        else:
+            print(
+                f"{name:<45} {result['realtime_factor']:8.1f}x realtime "
+                f"{result['samples_per_second'] / 1e6:8.2f} Msamples/s "
+                f"{measured['peak_rss_kb'] / 1024:7.1f} MiB peak RSS"
+            )
+    return results
+
+
+def _render_numpy(settings: pipeline_settings) -> str:
+    """Renders with the NumPy engine, returns error or None"""
+    from src.dsp import Engine
+
+    engine = Engine(settings)
+    engine.run()
+    return str(engine.error) if engine.error else None
+
+
+def compare_engines(input_file: str, directory: str) -> list:
+    """Renders every stage with both engines and checks src.dsp tolerances
+
+    Lowpass is compared by passband power spectrum, every other stage
+    sample by sample.
+    """
+    from scipy import signal
+    from src.dsp import PASSBAND_TOLERANCE, TOLERANCE, read_wav
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for stage in STAGES:
+        paths = {
+            engine: os.path.join(directory, f"compare_{stage}_{engine}.wav")
+            for engine in ("gstreamer", "numpy")
+        }
+        settings = benchmark_settings((stage,), input_file, paths["gstreamer"])
+        with context.Pool(1) as pool:
+            error = pool.apply(_measure, (settings,))["error"]
+        settings.output_file = paths["numpy"]
+        error = error or _render_numpy(settings)
+        if error:
+            results.append({"stage": stage, "error": error, "passed": False})
+            print(f"{stage:<10} FAILED: {error}")
+            continue
+
+        expected, rate = read_wav(paths["gstreamer"])
+        actual, _ = read_wav(paths["numpy"])
+        frames = min(len(expected), len(actual))
+        if stage == "lowpass":
+            freqs, expected_power = signal.welch(expected[:frames], rate, axis=0)
+            _, actual_power = signal.welch(actual[:frames], rate, axis=0)
+            passband = (freqs > 20) & (freqs <= settings.lowpass.cutoff)
+            difference = np.max(
+                np.abs(
+                    10 * np.log10(actual_power[passband] / expected_power[passband])
+                )
+            )
+            limit, unit = PASSBAND_TOLERANCE, "dB"
+        else:
+            difference = np.max(np.abs(actual[:frames] - expected[:frames]))
+            limit, unit = TOLERANCE, ""
+        passed = bool(difference <= limit) and len(expected) == len(actual)
+        results.append(
+            {
+                "stage": stage,
+                "difference": float(difference),
+                "limit": limit,
+                "frames": [len(expected), len(actual)],
+                "passed": passed,
+                "error": None,
+            }
+        )
+        print(
+            f"{stage:<10} {'ok' if passed else 'FAILED':<6} "
+            f"max difference {difference:.2e}{unit} (limit {limit:g}{unit}), "
+            f"{len(expected)}/{len(actual)} frames"
+        )
+    return results
+
+
+def run_queue_sweep(input_file: str, output_file: str) -> list:
+    """Compares wall time with and without queues for growing chains"""
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for count in range(1, len(STAGES) + 1):
+        stages = STAGES[:count]
+        walls = {}
+        for queues in (False, True):
+            settings = benchmark_settings(stages, input_file, output_file)
+            settings.queue.enabled = queues
+            with context.Pool(1) as pool:
+                measured = pool.apply(_measure, (settings,))
+            if measured["error"]:
+                print(f"{count} stages FAILED: {measured['error']}")
+                break
+            walls[queues] = measured["wall"]
+        if len(walls) < 2:
+            continue
+
+        results.append(
+            {"stages": count, "wall": walls[False], "wall_queues": walls[True]}
+        )
+        print(
+            f"{count} stages: {walls[False]:.2f}s without queues, "
+            f"{walls[True]:.2f}s with queues ({walls[False] / walls[True]:.2f}x)"
+        )
+    return results
+
+
+def measure_startup(repeats: int = 5) -> dict:
+    """Times GUI startup in fresh processes, median of repeats
+
+    GStreamer load is the first Run's extra cost when it happens after the
+    window is shown, as it should.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT],
+            cwd=root,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+
+    result = {
+        name: statistics.median(each[name] for each in runs)
+        for name in ("imports", "window_shown", "gstreamer_load")
+    }
+    result["gstreamer_before_window"] = any(
+        each["gstreamer_before_window"] for each in runs
+    )
+    print(
+        f"Window shown in {result['window_shown'] * 1000:.0f} ms "
+        f"({result['imports'] * 1000:.0f} ms imports), "
+        f"GStreamer loaded {result['gstreamer_load'] * 1000:.0f} ms later"
+    )
+    if result["gstreamer_before_window"]:
+        print("Warning: GStreamer is loaded before the window is shown")
+    return result
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Measures filter chain throughput for every combination of stages"
+    )
+    parser.add_argument(
+        "-i", "--input", help="Input file, synthetic noise if not given"
+    )
+    parser.add_argument(
+        "-d", "--duration", type=float, default=60.0, help="Synthetic input length (s)"
+    )
+    parser.add_argument("-o", "--output", default="benchmark.json", help="JSON report")
+    parser.add_argument(
+        "-q", "--queues", action="store_true", help="Also measure queues between stages"
+    )
+    parser.add_argument(
+        "-s", "--startup", action="store_true", help="Also measure GUI startup time"
+    )
+    parser.add_argument(
+        "-c",
+        "--compare",
+        action="store_true",
+        help="Also check NumPy engine output against GStreamer",
+    )
+    args = parser.parse_args(argv)
+
+    input_file = args.input
+    if not input_file:
+        input_file = synthetic_input("/tmp/benchmark_in.wav", args.duration)
+
+    combinations = [
+        stages
+        for count in range(1, len(STAGES) + 1)
+        for stages in itertools.combinations(STAGES, count)
+    ]
+    from src.pipeline import preflight
+
+    try:
+        for stages in combinations:
+            settings = benchmark_settings(stages, input_file, "/tmp/benchmark_out.wav")
+            settings.queue.enabled = args.queues
+            preflight(settings)
+    except SystemExit as e:
+        print(e)
+        return 1
+    results = run_benchmark(input_file, "/tmp/benchmark_out.wav", combinations)
+
+    report = {"input": input_file, "results": results}
+    if args.queues:
+        report["queue_sweep"] = run_queue_sweep(input_file, "/tmp/benchmark_out.wav")
+    if args.startup:
+        report["startup"] = measure_startup()
+    if args.compare:
+        report["comparison"] = compare_engines(input_file, "/tmp")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {args.output}")
+    failed = any(each["error"] for each in results) or not all(
+        each["passed"] for each in report.get("comparison", ())
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+from src.settings import pipeline_settings
+from src.files import place_file
+
+
+# Settings that do not change the rendered audio
+IGNORED = ("input_file", "output_file", "stream", "queue", "monitor", "analysis")
+
+
+class RenderCache:
+    """Rendered outputs on disk, keyed by input content and settings
+
+    Least recently used entries are removed once the cache grows over
+    max_size bytes.
+    """
+
+    def __init__(self, path: str = None, max_size: int = 2 * 1024 ** 3) -> None:
+        self.path = path or os.path.join(
+            os.path.expanduser("~"), ".cache", "procesory-sygnalowe", "renders"
+        )
+        self.max_size = max_size
+        # (path, size, mtime) -> content hash, so unchanged inputs are read once
+        self._hashes = {}
+
+    def _hash_file(self, path: str) -> str:
+        stat = os.stat(path)
+        memo = (path, stat.st_size, stat.st_mtime_ns)
+        if memo not in self._hashes:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            self._hashes[memo] = digest.hexdigest()
+        return self._hashes[memo]
+
+    def key(self, settings: pipeline_settings, engine: str = "gstreamer") -> str:
+        """Returns cache key of rendering settings.input_file with settings"""
+        data = {
+            name: value
+            for name, value in settings.to_dict().items()
+            if name not in IGNORED
+        }
+        # Engines agree only within a tolerance, keep their renders apart
+        data["engine"] = engine
+        canonical = json.dumps(data, sort_keys=True, separators=(",", ":"))
+        digest = hashlib.sha256(self._hash_file(settings.input_file).encode())
+        digest.update(canonical.encode())
+        return digest.hexdigest()
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.path, key)
+
+    def get(self, key: str) -> str:
+        """Returns path of cached render or None"""
+        entry = self._entry(key)
+        if not os.path.exists(entry):
+            return None
+        # Modification time orders entries for eviction
+        os.utime(entry)
+        return entry
+
+    def put(self, key: str, file: str) -> str:
+        """Stores rendered file, returns its path in the cache
+
+        Files larger than the whole cache are not stored and None is
+        returned, they would only evict everything else.
+        """
+        if os.path.getsize(file) > self.max_size:
+            return None
+        os.makedirs(self.path, exist_ok=True)
+        entry = self._entry(key)
+        # Copying may take a while, get() must never see a partial entry
+        partial = f"{entry}.partial"
+        place_file(file, partial)
+        os.replace(partial, entry)
+        self.evict()
+        return entry
+
+    def evict(self) -> None:
+        """Removes least recently used entries until the cache fits max_size"""
+        entries = []
+        for name in os.listdir(self.path):
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except FileNotFoundError:
+                # Removed by another process meanwhile
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+            total -= size
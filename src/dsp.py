@@ -0,0 +1,463 @@
+"""NumPy/SciPy implementation of the GStreamer filter chain.
+
+Engine applies the same pipeline_settings as Pipeline, but on whole blocks
+of samples without GStreamer or a GLib main loop. Filter designs follow the
+GStreamer elements:
+
+- highpass: audiowsinclimit windowed-sinc kernel, direct or partitioned
+  FFT overlap-add convolution depending on highpass.fft_threshold
+- lowpass: audiocheblimit Chebyshev filter as second order sections
+- echo: audioecho feedback comb filter
+- equalizer: equalizer-10bands shelf/peak biquads
+- karaoke: audiokaraoke center cut with band filtered mono signal
+
+Output is meant to match the GStreamer path within TOLERANCE (absolute,
+full scale is 1.0) for every stage except lowpass. audiocheblimit uses its
+own Chebyshev design, SciPy's should match its passband magnitude response
+within PASSBAND_TOLERANCE but is not sample exact. Both are checked by
+python -m src.benchmark --compare.
+"""
+import hashlib
+import math
+import os
+import time
+from collections import OrderedDict
+import numpy as np
+from scipy import signal
+from scipy.io import wavfile
+from src.settings import pipeline_settings
+
+TOLERANCE = 1e-3
+PASSBAND_TOLERANCE = 0.1  # dB
+
+
+class CoefficientCache:
+    """LRU cache of designed filter coefficients, optionally kept on disk
+
+    Keys are tuples of filter type, its parameters and sample rate, so
+    repeated presets skip the design step.
+    """
+
+    def __init__(self, size: int = 64, path: str = None) -> None:
+        self.size = size
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, design, *args) -> np.ndarray:
+        """Returns cached coefficients for key, calls design(*args) on a miss"""
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        file = None
+        if self.path:
+            name = hashlib.sha1(repr(key).encode()).hexdigest()
+            file = os.path.join(self.path, f"{name}.npy")
+
+        if file and os.path.exists(file):
+            self.hits += 1
+            value = np.load(file)
+        else:
+            self.misses += 1
+            value = design(*args)
+            if file:
+                # Written under temporary name, workers may share the directory
+                os.makedirs(self.path, exist_ok=True)
+                temp = f"{file}.{os.getpid()}.tmp"
+                with open(temp, "wb") as f:
+                    np.save(f, value)
+                os.replace(temp, file)
+
+        self.entries[key] = value
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        """Empties in-memory entries and resets counters"""
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# Shared by every Engine in the process
+coefficients = CoefficientCache()
+
+
+def read_wav(path: str) -> tuple:
+    """Reads WAV file, returns (samples as float64 [frames, channels], rate)"""
+    rate, data = wavfile.read(path)
+    if data.ndim == 1:
+        data = data[:, np.newaxis]
+    if data.dtype == np.uint8:
+        samples = (data.astype(np.float64) - 128) / 128
+    elif np.issubdtype(data.dtype, np.integer):
+        samples = data.astype(np.float64) / (np.iinfo(data.dtype).max + 1)
+    else:
+        samples = data.astype(np.float64)
+    return samples, rate
+
+
+def write_wav(path: str, samples: np.ndarray, rate: int) -> None:
+    """Writes samples as 32-bit float WAV file"""
+    wavfile.write(path, rate, samples.astype(np.float32))
+
+
+def sinc_kernel(
+    cutoff: float, length: int, mode: int, window: int, rate: int
+) -> np.ndarray:
+    """Windowed-sinc kernel, same design as audiowsinclimit"""
+    i = np.arange(length, dtype=np.float64)
+    center = (length - 1) / 2
+    w = 2 * math.pi * min(max(cutoff, 0.0), rate / 2) / rate
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kernel = np.sin(w * (i - (length - 1) // 2)) / (i - center)
+    kernel[i == center] = w
+
+    if window == 0:  # hamming
+        kernel *= 0.54 - 0.46 * np.cos(2 * math.pi * i / (length - 1))
+    elif window == 1:  # blackman
+        kernel *= (
+            0.42
+            - 0.5 * np.cos(2 * math.pi * i / (length - 1))
+            + 0.08 * np.cos(4 * math.pi * i / (length - 1))
+        )
+    elif window == 2:  # gaussian
+        kernel *= np.exp(-0.5 * (3.0 / length * (2 * i - (length - 1))) ** 2)
+    elif window == 3:  # cosine
+        kernel *= np.cos(math.pi * i / (length - 1) - math.pi / 2)
+    elif window == 4:  # hann
+        kernel *= 0.5 * (1 - np.cos(2 * math.pi * i / (length - 1)))
+
+    # Normalize for unity gain at DC, zero cutoff leaves nothing to pass
+    total = kernel.sum()
+    kernel = kernel / total if total else np.zeros(length)
+
+    if mode == 1:
+        # Spectral inversion turns lowpass into highpass
+        kernel = -kernel
+        if length % 2 == 1:
+            kernel[(length - 1) // 2] += 1.0
+        else:
+            kernel[length // 2 - 1] += 0.5
+            kernel[length // 2] += 0.5
+    return kernel
+
+
+def chebyshev_sos(
+    cutoff: float, mode: int, poles: int, ripple: float, type: int, rate: int
+) -> np.ndarray:
+    """Chebyshev filter as second order sections, mode 0 lowpass, 1 highpass"""
+    btype = "highpass" if mode == 1 else "lowpass"
+    # audiocheblimit rounds odd pole counts up
+    poles += poles % 2
+    if cutoff <= 0 or cutoff >= rate / 2:
+        # Outside of the usable range the filter either passes or blocks all
+        passes = (cutoff <= 0) == (mode == 1)
+        return np.array([[1.0 if passes else 0.0, 0, 0, 1, 0, 0]])
+    if ripple <= 0:
+        # Limit of both types, scipy divides by 10 ** (ripple / 10) - 1.
+        # Without passband ripple type 1 is Butterworth, without stopband
+        # attenuation type 2 passes everything.
+        if type == 2:
+            return np.array([[1.0, 0, 0, 1, 0, 0]])
+        return signal.butter(poles, cutoff, btype, fs=rate, output="sos")
+    if type == 2:
+        return signal.cheby2(poles, ripple, cutoff, btype, fs=rate, output="sos")
+    return signal.cheby1(poles, ripple, cutoff, btype, fs=rate, output="sos")
+
+
+def equalizer_sos(bands: list, rate: int) -> np.ndarray:
+    """equalizer-10bands as second order sections, bands with 0 dB are skipped"""
+    count = len(bands)
+    step = (20000.0 / 20.0) ** (1.0 / count)
+    sections = []
+    low = 20.0
+    for index, gain in enumerate(bands):
+        high = low * step
+        freq = low + (high - low) / 2
+        width = high - low
+        low = high
+        if gain == 0 or width <= 0:
+            continue
+
+        g = 10.0 ** (gain / 40.0)
+        omega = math.pi if freq / rate >= 0.5 else 2 * math.pi * freq / rate
+        bw = math.pi - 1e-8 if width / rate >= 0.5 else 2 * math.pi * width / rate
+        alpha = math.tan(bw / 2)
+        cos = math.cos(omega)
+
+        if index == 0:  # low shelf
+            delta = 2 * math.sqrt(g) * alpha
+            norm = (g + 1) + (g - 1) * cos + delta
+            b = [
+                ((g + 1) - (g - 1) * cos + delta) * g,
+                ((g - 1) - (g + 1) * cos) * 2 * g,
+                ((g + 1) - (g - 1) * cos - delta) * g,
+            ]
+            a = [norm, -((g - 1) + (g + 1) * cos) * 2, (g + 1) + (g - 1) * cos - delta]
+        elif index == count - 1:  # high shelf
+            delta = 2 * math.sqrt(g) * alpha
+            norm = (g + 1) - (g - 1) * cos + delta
+            b = [
+                ((g + 1) + (g - 1) * cos + delta) * g,
+                ((g - 1) + (g + 1) * cos) * -2 * g,
+                ((g + 1) + (g - 1) * cos - delta) * g,
+            ]
+            a = [norm, ((g - 1) - (g + 1) * cos) * 2, (g + 1) - (g - 1) * cos - delta]
+        else:  # peak
+            norm = 1 + alpha / g
+            b = [1 + alpha * g, -2 * cos, 1 - alpha * g]
+            a = [norm, -2 * cos, 1 - alpha / g]
+
+        sections.append([each / norm for each in b] + [each / norm for each in a])
+
+    if not sections:
+        return np.array([[1.0, 0, 0, 1, 0, 0]])
+    return np.array(sections)
+
+
+def partitioned_convolve(
+    samples: np.ndarray, kernel: np.ndarray, block: int
+) -> np.ndarray:
+    """Uniformly partitioned FFT overlap-add, returns full convolution"""
+    frames, channels = samples.shape
+    taps = len(kernel)
+    size = 2 * block
+    parts = -(-taps // block)
+    blocks = -(-frames // block)
+
+    padded = np.zeros(parts * block)
+    padded[:taps] = kernel
+    spectra = np.fft.rfft(padded.reshape(parts, block), n=size, axis=1)
+
+    padded = np.zeros((blocks * block, channels))
+    padded[:frames] = samples
+    inputs = np.fft.rfft(padded.reshape(blocks, block, channels), n=size, axis=1)
+
+    # Each kernel partition adds its product to the output delayed by its index
+    outputs = np.zeros((blocks + parts - 1,) + inputs.shape[1:], dtype=complex)
+    for index, spectrum in enumerate(spectra):
+        outputs[index : index + blocks] += inputs * spectrum[np.newaxis, :, np.newaxis]
+    pieces = np.fft.irfft(outputs, n=size, axis=1)
+
+    out = np.zeros(((len(pieces) + 1) * block, channels))
+    out[: len(pieces) * block] += pieces[:, :block].reshape(-1, channels)
+    out[block:] += pieces[:, block:].reshape(-1, channels)
+    return out[: frames + taps - 1]
+
+
+def fir_filter(
+    samples: np.ndarray, kernel: np.ndarray, fft_threshold: int = 64
+) -> np.ndarray:
+    """FIR filter with latency compensation, output is aligned with input
+
+    Kernels shorter than fft_threshold taps use direct convolution, longer
+    ones the partitioned overlap-add convolver.
+    """
+    taps = len(kernel)
+    if taps < fft_threshold:
+        full = signal.convolve(samples, kernel[:, np.newaxis], method="direct")
+    else:
+        block = min(1 << (taps - 1).bit_length(), 4096)
+        full = partitioned_convolve(samples, kernel, block)
+
+    latency = taps // 2
+    return full[latency : latency + len(samples)]
+
+
+def echo(
+    samples: np.ndarray, delay: int, feedback: float, intensity: float
+) -> np.ndarray:
+    """audioecho comb filter, delay in frames"""
+    delay = max(delay, 1)
+    if delay >= len(samples):
+        return samples.copy()
+
+    # Delay line w[n] = x[n] + feedback * w[n - delay], one block per delay
+    line = np.empty_like(samples)
+    line[:delay] = samples[:delay]
+    for start in range(delay, len(samples), delay):
+        stop = min(start + delay, len(samples))
+        line[start:stop] = (
+            samples[start:stop] + feedback * line[start - delay : stop - delay]
+        )
+
+    out = samples.copy()
+    out[delay:] += intensity * line[:-delay]
+    return out
+
+
+def karaoke(
+    samples: np.ndarray,
+    filter_band: float,
+    filter_width: float,
+    level: float,
+    mono_level: float,
+    rate: int,
+) -> np.ndarray:
+    """audiokaraoke center cut, only stereo input is changed"""
+    if samples.shape[1] != 2:
+        return samples.copy()
+
+    c = math.exp(-2 * math.pi * filter_width / rate)
+    b = -4 * c / (1 + c) * math.cos(2 * math.pi * filter_band / rate)
+    a = math.sqrt(1 - b * b / (4 * c)) * (1 - c)
+
+    left, right = samples[:, 0], samples[:, 1]
+    # audiokaraoke scales the filtered mono signal by level as well
+    mono = signal.lfilter([a], [1, b, c], (left + right) / 2) * mono_level * level
+    return np.stack((left - right * level + mono, right - left * level + mono), axis=1)
+
+
+def plan_stages(settings: pipeline_settings, rate: int) -> tuple:
+    """Designs enabled stages, fusing the linear time-invariant ones
+
+    Every stage except karaoke filters each channel the same way, and
+    karaoke only mixes channels linearly, so the chain can be reordered
+    freely. All Chebyshev and equalizer biquads go into one SOS cascade
+    that is applied in a single pass.
+
+    Returns (stages, fused) where stages is a list of (kind, parameters)
+    and fused is the number of enabled stages merged into another one.
+    """
+    stages = []
+    sections = []
+
+    if settings.highpass.enabled:
+        hp = settings.highpass
+        key = ("sinc", hp.cutoff, hp.length, hp.mode, hp.window, rate)
+        kernel = coefficients.get(
+            key, sinc_kernel, hp.cutoff, hp.length, hp.mode, hp.window, rate
+        )
+        stages.append(("fir", (kernel, hp.fft_threshold)))
+
+    if settings.lowpass.enabled:
+        lp = settings.lowpass
+        key = ("chebyshev", lp.cutoff, lp.mode, lp.poles, lp.ripple, lp.type, rate)
+        sections.append(
+            coefficients.get(
+                key,
+                chebyshev_sos,
+                lp.cutoff,
+                lp.mode,
+                lp.poles,
+                lp.ripple,
+                lp.type,
+                rate,
+            )
+        )
+
+    if settings.equalizer.enabled:
+        bands = tuple(settings.equalizer.bands)
+        sections.append(
+            coefficients.get(("equalizer", bands, rate), equalizer_sos, bands, rate)
+        )
+
+    if sections:
+        stages.append(("sos", np.concatenate(sections)))
+
+    if settings.echo.enabled:
+        # audioecho truncates the delay to whole frames, at least one
+        delay = max(settings.echo.delay * rate // 1_000_000_000, 1)
+        stages.append(
+            ("echo", (delay, settings.echo.feedback, settings.echo.intensity))
+        )
+
+    if settings.karaoke.enabled:
+        k = settings.karaoke
+        stages.append(
+            (
+                "karaoke",
+                (k.filter_band, k.filter_width, k.level, k.mono_level, rate),
+            )
+        )
+
+    return stages, max(len(sections) - 1, 0)
+
+
+class Engine:
+    """Block based alternative to Pipeline with the same run/reset interface"""
+
+    def __init__(self, settings: pipeline_settings) -> None:
+        self.settings = settings
+
+        self.rate = 0
+        self.channels = 0
+        self.duration = 0  # ns
+        self.error = None
+        self.fused = 0
+        self.encode_time = 0.0  # s
+
+        if not any(getattr(settings, each).enabled for each in settings.filters):
+            raise SystemExit("Error: No elements were created")
+        if settings.output.encoder not in ("wav", "raw"):
+            raise SystemExit(f"Error: {settings.output.encoder} output needs GStreamer")
+
+    def process(self, samples: np.ndarray, rate: int) -> np.ndarray:
+        """Applies enabled stages, see plan_stages"""
+        stages, self.fused = plan_stages(self.settings, rate)
+
+        for kind, parameters in stages:
+            if kind == "fir":
+                samples = fir_filter(samples, *parameters)
+            elif kind == "sos":
+                samples = signal.sosfilt(parameters, samples, axis=0)
+            elif kind == "echo":
+                samples = echo(samples, *parameters)
+            elif kind == "karaoke":
+                samples = karaoke(samples, *parameters)
+
+        return samples
+
+    def run(self) -> None:
+        """Processes input file and writes output file"""
+        try:
+            samples, rate = read_wav(self.settings.input_file)
+            self.channels = samples.shape[1]
+            # Same policy as Pipeline, only ever resample down
+            target = self.settings.processing.rate
+            self.rate = min(rate, target) if target else rate
+            if self.rate != rate:
+                common = math.gcd(rate, self.rate)
+                samples = signal.resample_poly(
+                    samples, self.rate // common, rate // common, axis=0
+                )
+            processed = self.process(samples, self.rate)
+            start = time.perf_counter()
+            if self.settings.output.encoder == "raw":
+                processed.astype("<f4").tofile(self.settings.output_file)
+            else:
+                write_wav(self.settings.output_file, processed, self.rate)
+            self.encode_time = time.perf_counter() - start
+            self.duration = int(len(samples) * 1e9 / self.rate)
+        except Exception as e:
+            self.error = e
+            print(f"Error: {e}")
+
+    def reset(self, input_file: str, output_file: str) -> None:
+        """Sets files for the next run"""
+        self.settings.input_file = input_file
+        self.settings.output_file = output_file
+
+        self.rate = 0
+        self.channels = 0
+        self.duration = 0
+        self.error = None
+        self.encode_time = 0.0
+
+    def output_report(self) -> dict:
+        """Returns encoder name, bytes written and time spent writing (s)"""
+        location = self.settings.output_file
+        return {
+            "encoder": self.settings.output.encoder,
+            "bytes": os.path.getsize(location) if os.path.exists(location) else 0,
+            "encode_time": self.encode_time,
+        }
+
+    def kill(self) -> None:
+        """Nothing to release, kept for parity with Pipeline"""
@@ -0,0 +1,55 @@
+import fcntl
+import os
+from shutil import copyfile
+
+
+# Linux ioctl sharing extents between files on btrfs, XFS and similar
+FICLONE = 0x40049409
+
+
+def _reflink(src: str, dst: str) -> None:
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            target.close()
+            os.remove(dst)
+            raise
+
+
+def place_file(src: str, dst: str, move: bool = False) -> str:
+    """Puts src at dst without copying data where possible
+
+    Tries rename (only when move is set), reflink and hard link before
+    falling back to a full copy. Returns name of the strategy used.
+    """
+    if os.path.abspath(src) == os.path.abspath(dst) or (
+        os.path.exists(dst) and os.path.samefile(src, dst)
+    ):
+        # Removing dst would delete src, it is already in place
+        return "in place"
+
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+    if move:
+        try:
+            os.rename(src, dst)
+            return "rename"
+        except OSError:
+            pass
+
+    try:
+        _reflink(src, dst)
+        return "reflink"
+    except OSError:
+        pass
+
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        pass
+
+    copyfile(src, dst)
+    return "copy"
@@ -0,0 +1,127 @@
+import json
+import time
+
+
+class PipelineMetrics:
+    """Per stage buffer counts, bytes and processing time, plus state changes
+
+    Buffers are timed between probes on the sink and src pad of each
+    element, so the time covers only the element's own processing.
+    """
+
+    def __init__(self) -> None:
+        self.stages = {}
+        self.state_changes = {}
+        self.build = 0.0  # s
+        self._entered = {}
+        self._mark = time.perf_counter()
+
+    def attach(self, name: str, element) -> None:
+        """Adds pad probes to element, it is reported as name"""
+        from gi.repository import Gst
+
+        self.stages[name] = {"buffers": 0, "bytes": 0, "time": 0.0, "max_time": 0.0}
+        sink = element.get_static_pad("sink")
+        src = element.get_static_pad("src")
+        sink.add_probe(Gst.PadProbeType.BUFFER, self._on_sink_buffer, name)
+        src.add_probe(Gst.PadProbeType.BUFFER, self._on_src_buffer, name)
+
+    def _on_sink_buffer(self, pad, info, name):
+        """Counts incoming buffer and remembers when it entered the element"""
+        from gi.repository import Gst
+
+        stage = self.stages[name]
+        stage["buffers"] += 1
+        stage["bytes"] += info.get_buffer().get_size()
+        self._entered[name] = time.perf_counter()
+        return Gst.PadProbeReturn.OK
+
+    def _on_src_buffer(self, pad, info, name):
+        """Adds time since the last incoming buffer to the stage"""
+        from gi.repository import Gst
+
+        entered = self._entered.pop(name, None)
+        if entered is not None:
+            spent = time.perf_counter() - entered
+            stage = self.stages[name]
+            stage["time"] += spent
+            stage["max_time"] = max(stage["max_time"], spent)
+        return Gst.PadProbeReturn.OK
+
+    def mark(self) -> None:
+        """Starts timing a state change, called right before set_state"""
+        self._mark = time.perf_counter()
+
+    def state_changed(self, old: str, new: str) -> None:
+        """Records time since the last mark or state change"""
+        now = time.perf_counter()
+        transition = f"{old}_TO_{new}"
+        self.state_changes[transition] = self.state_changes.get(transition, 0.0) + (
+            now - self._mark
+        )
+        self._mark = now
+
+    def reset(self) -> None:
+        """Zeroes counters, attached probes stay in place"""
+        for stage in self.stages.values():
+            stage.update(buffers=0, bytes=0, time=0.0, max_time=0.0)
+        self.state_changes = {}
+        self.build = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "build": self.build,
+            "state_changes": dict(self.state_changes),
+            "stages": {name: dict(stage) for name, stage in self.stages.items()},
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self) -> str:
+        return prometheus(self.to_dict())
+
+
+def merge(reports: list) -> dict:
+    """Sums metrics dicts from to_dict(), e.g. from several batch workers"""
+    merged = {"build": 0.0, "state_changes": {}, "stages": {}}
+    for report in reports:
+        merged["build"] += report["build"]
+        for transition, seconds in report["state_changes"].items():
+            merged["state_changes"][transition] = (
+                merged["state_changes"].get(transition, 0.0) + seconds
+            )
+        for name, stage in report["stages"].items():
+            total = merged["stages"].setdefault(
+                name, {"buffers": 0, "bytes": 0, "time": 0.0, "max_time": 0.0}
+            )
+            total["buffers"] += stage["buffers"]
+            total["bytes"] += stage["bytes"]
+            total["time"] += stage["time"]
+            total["max_time"] = max(total["max_time"], stage["max_time"])
+    return merged
+
+
+def prometheus(report: dict) -> str:
+    """Formats metrics dict in Prometheus text exposition format"""
+    lines = [
+        "# TYPE pipeline_build_seconds gauge",
+        f"pipeline_build_seconds {report['build']}",
+        "# TYPE pipeline_state_change_seconds gauge",
+    ]
+    for transition, seconds in report["state_changes"].items():
+        lines.append(
+            f'pipeline_state_change_seconds{{transition="{transition}"}} {seconds}'
+        )
+
+    metrics = (
+        ("buffers", "pipeline_stage_buffers_total", "counter"),
+        ("bytes", "pipeline_stage_bytes_total", "counter"),
+        ("time", "pipeline_stage_processing_seconds_total", "counter"),
+        ("max_time", "pipeline_stage_buffer_seconds_max", "gauge"),
+    )
+    for key, metric, kind in metrics:
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, stage in report["stages"].items():
+            lines.append(f'{metric}{{stage="{name}"}} {stage[key]}')
+    return "\n".join(lines) + "\n"
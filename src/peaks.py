@@ -0,0 +1,227 @@
+"""Min/max peak pyramid and coarse spectrogram for drawing long files.
+
+Level 0 holds min and max of every BLOCK frames, each further level halves
+the previous one, so any zoom is drawn from at most twice as many values
+as there are pixels. Both are computed in one streaming decode and saved
+next to the input as <input>.peaks.npz, or in the user cache directory when
+that is not writable.
+"""
+import hashlib
+import os
+import numpy as np
+
+
+BLOCK = 256  # frames per level 0 value
+FFT_SIZE = 4096  # frames per spectrogram column
+SPECTRUM_BANDS = 64  # logarithmic, 20 Hz to half the sample rate
+FLOOR = -100.0  # dB, bottom of the spectrogram scale
+# Bump when the file layout changes, older files are rebuilt
+VERSION = 1
+
+
+class PeakPyramid:
+    def __init__(
+        self, levels: list, spectrogram: np.ndarray, rate: int, frames: int
+    ) -> None:
+        # [blocks, 2] float32 min/max, a value of level n spans BLOCK * 2**n frames
+        self.levels = levels
+        # [columns, SPECTRUM_BANDS] uint8, 255 is 0 dB and 0 is FLOOR
+        self.spectrogram = spectrogram
+        self.rate = rate
+        self.frames = frames
+
+    def range(self, start: int, end: int, width: int) -> np.ndarray:
+        """Returns [width, 2] min/max of frames start..end, one row per pixel"""
+        start, end = max(start, 0), min(end, self.frames)
+        if end <= start or width <= 0:
+            return np.zeros((0, 2), dtype=np.float32)
+        # Coarsest level that still has a value for every pixel
+        per_pixel = (end - start) / width
+        level = 0
+        while level + 1 < len(self.levels) and BLOCK * 2 ** (level + 1) <= per_pixel:
+            level += 1
+        size = BLOCK * 2 ** level
+        values = self.levels[level][start // size : -(-end // size)]
+        if not len(values):
+            return np.zeros((0, 2), dtype=np.float32)
+
+        edges = np.linspace(0, len(values), min(width, len(values)) + 1).astype(int)
+        starts = edges[:-1]
+        return np.stack(
+            (
+                np.minimum.reduceat(values[:, 0], starts),
+                np.maximum.reduceat(values[:, 1], starts),
+            ),
+            axis=1,
+        )
+
+    def spectrum(self, start: int, end: int) -> np.ndarray:
+        """Returns spectrogram columns covering frames start..end"""
+        return self.spectrogram[max(start, 0) // FFT_SIZE : -(-end // FFT_SIZE)]
+
+
+class _Builder:
+    """Accumulates pyramid and spectrogram from consecutive blocks of samples"""
+
+    def __init__(self, rate: int) -> None:
+        self.rate = rate
+        self.frames = 0
+        self.minmax = []
+        self.columns = []
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.window = np.hanning(FFT_SIZE)
+
+        bins = np.fft.rfftfreq(FFT_SIZE, 1 / rate)
+        edges = np.geomspace(20.0, rate / 2, SPECTRUM_BANDS + 1)
+        index = np.searchsorted(edges, bins, side="right") - 1
+        index = np.minimum(index, SPECTRUM_BANDS - 1)
+        # Averages FFT bins into bands, bins below 20 Hz are dropped
+        self.weights = np.zeros((len(bins), SPECTRUM_BANDS))
+        valid = index >= 0
+        self.weights[np.flatnonzero(valid), index[valid]] = 1
+        self.weights /= np.maximum(self.weights.sum(axis=0), 1)
+
+    def add(self, samples: np.ndarray) -> None:
+        """Adds [frames, channels] block, channels are mixed down"""
+        mono = samples.mean(axis=1, dtype=np.float32)
+        self.frames += len(mono)
+        data = np.concatenate((self.pending, mono))
+        # Whole FFT_SIZE chunks only, it is a multiple of BLOCK
+        usable = len(data) - len(data) % FFT_SIZE
+        self._process(data[:usable])
+        self.pending = data[usable:]
+
+    def _process(self, data: np.ndarray) -> None:
+        if not len(data):
+            return
+        blocks = data.reshape(-1, BLOCK)
+        self.minmax.append(
+            np.stack((blocks.min(axis=1), blocks.max(axis=1)), axis=1)
+        )
+
+        chunks = data.reshape(-1, FFT_SIZE) * self.window
+        power = np.square(np.abs(np.fft.rfft(chunks, axis=1))) / FFT_SIZE
+        with np.errstate(divide="ignore"):
+            db = 10 * np.log10(power @ self.weights)
+        scaled = np.clip((db - FLOOR) / -FLOOR * 255, 0, 255)
+        self.columns.append(scaled.astype(np.uint8))
+
+    def finish(self) -> PeakPyramid:
+        # Zero padding, the last block only ever adds silence to min/max
+        tail = len(self.pending)
+        if tail:
+            self._process(np.pad(self.pending, (0, FFT_SIZE - tail)))
+        level = (
+            np.concatenate(self.minmax)
+            if self.minmax
+            else np.zeros((0, 2), dtype=np.float32)
+        )
+        spectrogram = (
+            np.concatenate(self.columns)
+            if self.columns
+            else np.zeros((0, SPECTRUM_BANDS), dtype=np.uint8)
+        )
+
+        levels = [level]
+        while len(level) > 1:
+            if len(level) % 2:
+                level = np.concatenate((level, level[-1:]))
+            pairs = level.reshape(-1, 2, 2)
+            level = np.stack(
+                (pairs[:, :, 0].min(axis=1), pairs[:, :, 1].max(axis=1)), axis=1
+            )
+            levels.append(level)
+        return PeakPyramid(levels, spectrogram, self.rate, self.frames)
+
+
+def build_peaks(path: str) -> PeakPyramid:
+    """Decodes any file GStreamer can read, in a single streaming pass"""
+    import gi
+
+    gi.require_version("Gst", "1.0")
+    from gi.repository import Gst
+
+    Gst.init(None)
+    pipeline = Gst.parse_launch(
+        "filesrc name=src ! decodebin ! audioconvert "
+        "! audio/x-raw,format=F32LE,layout=interleaved "
+        "! appsink name=sink sync=false max-buffers=8"
+    )
+    pipeline.get_by_name("src").set_property("location", path)
+    sink = pipeline.get_by_name("sink")
+    bus = pipeline.get_bus()
+
+    builder = None
+    pipeline.set_state(Gst.State.PLAYING)
+    try:
+        while True:
+            sample = sink.emit("try-pull-sample", Gst.SECOND // 10)
+            if sample:
+                if builder is None:
+                    structure = sample.get_caps().get_structure(0)
+                    _, rate = structure.get_int("rate")
+                    _, channels = structure.get_int("channels")
+                    builder = _Builder(rate)
+                buffer = sample.get_buffer()
+                data = buffer.extract_dup(0, buffer.get_size())
+                builder.add(np.frombuffer(data, dtype="<f4").reshape(-1, channels))
+            elif sink.get_property("eos"):
+                break
+            else:
+                msg = bus.pop_filtered(Gst.MessageType.ERROR)
+                if msg:
+                    raise RuntimeError(msg.parse_error()[0].message)
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+
+    if builder is None:
+        raise RuntimeError(f"No audio in {path}")
+    return builder.finish()
+
+
+def cache_path(path: str) -> str:
+    """Returns where peaks of path are stored, next to it when writable"""
+    directory = os.path.dirname(os.path.abspath(path))
+    if os.access(directory, os.W_OK):
+        return f"{path}.peaks.npz"
+    name = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()
+    directory = os.path.join(
+        os.path.expanduser("~"), ".cache", "procesory-sygnalowe", "peaks"
+    )
+    return os.path.join(directory, f"{name}.npz")
+
+
+def load_peaks(path: str) -> PeakPyramid:
+    """Returns peaks of path, from cache unless the file changed since"""
+    stat = os.stat(path)
+    stamp = np.array([VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+    cached = cache_path(path)
+    try:
+        with np.load(cached) as data:
+            if np.array_equal(data["stamp"], stamp):
+                count = int(data["count"])
+                return PeakPyramid(
+                    [data[f"level{i}"] for i in range(count)],
+                    data["spectrogram"],
+                    int(data["rate"]),
+                    int(data["frames"]),
+                )
+    except (OSError, KeyError, ValueError):
+        # Missing, stale layout or partially written
+        pass
+
+    peaks = build_peaks(path)
+    os.makedirs(os.path.dirname(os.path.abspath(cached)), exist_ok=True)
+    # np.savez adds .npz to names without it
+    partial = f"{cached}.partial.npz"
+    np.savez(
+        partial,
+        stamp=stamp,
+        count=len(peaks.levels),
+        rate=peaks.rate,
+        frames=peaks.frames,
+        spectrogram=peaks.spectrogram,
+        **{f"level{i}": level for i, level in enumerate(peaks.levels)},
+    )
+    os.replace(partial, cached)
+    return peaks
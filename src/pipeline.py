@@ -3,14 +3,127 @@ import gi
 gi.require_version("Gst", "1.0")
 gi.require_version("GstAudio", "1.0")
 from gi.repository import Gst, GObject, GLib
-from src.settings import pipeline_settings
+from src.settings import pipeline_settings, load_settings
+from src.metrics import PipelineMetrics
+from src.analysis import LevelAnalyzer, write_sidecar
+import argparse
+import functools
 import os
+import sys
+import time
 
 Gst.init(None)
 
+# Sample format of blocks() and raw output
+FLOAT_CAPS = "audio/x-raw,format=F32LE,layout=interleaved"
+# Processing formats, every filter element accepts them except audiokaraoke F64LE
+FORMATS = ("F32LE", "F64LE")
+# Elements reported by conversions when their output differs from their input
+CONVERTERS = ("audioconvert", "audioresample")
+
+# Elements between the filter chain and filesink, the last one is the encoder
+ENCODERS = {
+    "wav": ("wavenc",),
+    "flac": ("audioconvert", "flacenc"),
+    "vorbis": ("audioconvert", "vorbisenc"),
+    "opus": ("audioconvert", "audioresample", "opusenc"),
+    "raw": ("audioconvert", "capsfilter"),
+}
+
+# Filter element of every settings.filters section
+FILTERS = {
+    "highpass": "audiowsinclimit",
+    "lowpass": "audiocheblimit",
+    "echo": "audioecho",
+    "equalizer": "equalizer-10bands",
+    "karaoke": "audiokaraoke",
+}
+# Package to install for a missing element, named by preflight()
+PLUGINS = {
+    "filesrc": "gstreamer",
+    "filesink": "gstreamer",
+    "capsfilter": "gstreamer",
+    "queue": "gstreamer",
+    "decodebin": "gst-plugins-base",
+    "audioconvert": "gst-plugins-base",
+    "audioresample": "gst-plugins-base",
+    "appsink": "gst-plugins-base",
+    "playbin": "gst-plugins-base",
+    "oggmux": "gst-plugins-base",
+    "vorbisenc": "gst-plugins-base",
+    "opusenc": "gst-plugins-base",
+    "wavenc": "gst-plugins-good",
+    "flacenc": "gst-plugins-good",
+    "autoaudiosink": "gst-plugins-good",
+    "audiowsinclimit": "gst-plugins-good",
+    "audiocheblimit": "gst-plugins-good",
+    "audioecho": "gst-plugins-good",
+    "equalizer-10bands": "gst-plugins-good",
+    "audiokaraoke": "gst-plugins-good",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def element_available(factory: str) -> bool:
+    """Looks factory up in the plugin registry, once per process"""
+    return Gst.ElementFactory.find(factory) is not None
+
+
+def required_elements(
+    settings: pipeline_settings, stream: bool = False, monitor: bool = False
+) -> list:
+    """Returns factory names of every element Pipeline creates for settings"""
+    names = ["filesrc", "decodebin", "audioconvert", "audioresample", "capsfilter"]
+    names += [
+        FILTERS[each] for each in settings.filters if getattr(settings, each).enabled
+    ]
+    if settings.queue.enabled:
+        names.append("queue")
+    if stream:
+        names.append("appsink")
+    elif monitor:
+        names.append(settings.monitor.sink)
+    else:
+        names += ENCODERS.get(settings.output.encoder, ())
+        names.append("filesink")
+        if settings.output.encoder in ("vorbis", "opus"):
+            names.append("oggmux")
+    return list(dict.fromkeys(names))
+
+
+def preflight(
+    settings: pipeline_settings, stream: bool = False, monitor: bool = False
+) -> None:
+    """Exits with a clear message if an element needed by settings is missing
+
+    Runs before any file is opened, instead of failing on None.set_property
+    once decoding has started.
+    """
+    missing = [
+        each
+        for each in required_elements(settings, stream, monitor)
+        if not element_available(each)
+    ]
+    if missing:
+        names = ", ".join(
+            f"{each} ({PLUGINS.get(each, 'unknown plugin')})" for each in missing
+        )
+        raise SystemExit(f"Error: Missing GStreamer elements: {names}")
+
 
 class Pipeline:
-    def __init__(self, settings: pipeline_settings) -> None:
+    def __init__(
+        self,
+        settings: pipeline_settings,
+        stream: bool = False,
+        metrics: bool = False,
+        monitor: bool = False,
+        bypass: bool = False,
+    ) -> None:
+
+        preflight(settings, stream, monitor)
+        started = time.perf_counter()
+        self.metrics = PipelineMetrics() if metrics else None
 
         self.mainloop = GLib.MainLoop()
         self.pipeline = Gst.Pipeline()
@@ -19,9 +132,25 @@ class Pipeline:
         self.bus.add_signal_watch()
         self.bus.connect("message::eos", self.on_eos)
         self.bus.connect("message::error", self.on_error)
+        if self.metrics:
+            # Sync handler runs in the posting thread, with or without a main loop
+            self.bus.enable_sync_message_emission()
+            self.bus.connect("sync-message::state-changed", self._on_state_changed)
 
         self.settings = settings
 
+        # Filled in while running
+        self.rate = 0
+        self.channels = 0
+        self.duration = 0  # ns
+        self.error = None
+        self.running = False
+        self.cancelled = False
+        self.largest_block = 0
+        self.block_pts = 0  # ns, timestamp of the last block from blocks()
+        self.ahead = []  # ns, how early processed buffers reach the monitor sink
+        self.conversions = []  # converters that changed the format, see on_eos
+
         # Filesrc
         self.src = Gst.ElementFactory.make("filesrc")
         self.src.set_property("location", self.settings.input_file)
@@ -30,100 +159,349 @@ class Pipeline:
         self.decodebin = Gst.ElementFactory.make("decodebin")
         self.decodebin.connect("pad-added", self._on_pad_added)
 
-        # Audio convert
+        # Audio convert, passthrough when decoded caps already match the working caps
         self.audioconvert = Gst.ElementFactory.make("audioconvert", "convert")
+        self._working()
 
         self.highpass = None
         self.lowpass = None
         self.echo = None
         self.equalizer = None
         self.karaoke = None
+        self.queues = []
+        # Input passes unfiltered, e.g. the original side of an A/B comparison
+        self.bypass = bypass
 
-        if self.settings.highpass.enabled:
+        if self.settings.highpass.enabled and not bypass:
             self._highpass_filter()
 
-        if self.settings.lowpass.enabled:
+        if self.settings.lowpass.enabled and not bypass:
             self._lowpass_filter()
 
-        if self.settings.echo.enabled:
+        if self.settings.echo.enabled and not bypass:
             self._echo()
 
-        if self.settings.equalizer.enabled:
+        if self.settings.equalizer.enabled and not bypass:
             self._equalizer()
 
-        if self.settings.karaoke.enabled:
+        if self.settings.karaoke.enabled and not bypass:
             self._karaoke()
 
-        self.wavenc = Gst.ElementFactory.make("wavenc")
-        self.filesink = Gst.ElementFactory.make("filesink")
-        self.filesink.set_property("location", self.settings.output_file)
+        # Sink side, self.tail is the element the last filter links to
+        self.encoder = None
+        self.filesink = None
+        self.appsink = None
+        self.monitor = None
+        self.tail = None
+        self.encoding = None  # PipelineMetrics of the encoder
+        # LevelAnalyzer of the chain input and output, see _link
+        self.before = None
+        self.after = None
+
+        if stream and monitor:
+            raise ValueError("stream and monitor outputs are exclusive")
+        if stream:
+            self._appsink()
+        elif monitor:
+            self._monitorsink()
+        else:
+            self._filesink()
 
         # Add elements to the pipeline
         self.pipeline.add(self.src)
         self.pipeline.add(self.decodebin)
         self.pipeline.add(self.audioconvert)
-        self.pipeline.add(self.wavenc)
-        self.pipeline.add(self.filesink)
+        self.pipeline.add(self.resample)
+        self.pipeline.add(self.working)
 
         # Link elements
         self.src.link(self.decodebin)
-        self.wavenc.link(self.filesink)
+        self.audioconvert.link(self.resample)
+        self.resample.link(self.working)
         self._link()
 
+        if self.metrics:
+            for name in self.settings.filters:
+                element = getattr(self, name)
+                if element:
+                    self.metrics.attach(name, element)
+            self.metrics.build = time.perf_counter() - started
+
+    def _set_state(self, state: Gst.State) -> None:
+        """Changes pipeline state, timing it when metrics are enabled"""
+        if self.metrics:
+            self.metrics.mark()
+        self.pipeline.set_state(state)
+
+    def _on_state_changed(self, bus, msg) -> None:
+        """Sync callback recording pipeline state changes in metrics"""
+        if msg.src == self.pipeline:
+            old, new, _ = msg.parse_state_changed()
+            self.metrics.state_changed(
+                Gst.Element.state_get_name(old), Gst.Element.state_get_name(new)
+            )
+
     def _on_pad_added(self, decodebin, pad) -> None:
         """Used as callback to connect decodebin to the pipeline."""
-        caps = pad.get_current_caps()
+        caps = pad.get_current_caps() or pad.query_caps(None)
+        structure = caps.get_structure(0)
+        # Containers may also hold video or subtitles, only one audio stream is used
+        if not structure.get_name().startswith("audio/"):
+            return
+        if self.audioconvert.get_static_pad("sink").is_linked():
+            return
+        _, rate = structure.get_int("rate")
+        _, self.channels = structure.get_int("channels")
+        # Only ever resample down, upsampling costs CPU without adding anything
+        target = self.settings.processing.rate
+        self.rate = min(rate, target) if target else rate
+        self.working.set_property("caps", self._working_caps(self.rate))
         compatible_pad = self.audioconvert.get_compatible_pad(pad, caps)
         pad.link(compatible_pad)
 
+    def _working(self) -> None:
+        """Adds audioresample and capsfilter fixing format and rate of the chain"""
+        processing = self.settings.processing
+        if processing.format not in FORMATS:
+            raise SystemExit(f"Error: Unknown processing format {processing.format}")
+        if processing.format != "F32LE" and self.settings.karaoke.enabled:
+            raise SystemExit("Error: audiokaraoke needs F32LE processing format")
+
+        # Passthrough unless the input rate is above processing.rate
+        self.resample = Gst.ElementFactory.make("audioresample", "resample")
+        self.resample.set_property("quality", processing.resample_quality)
+        # Rate is added once the input rate is known, see _on_pad_added
+        self.working = Gst.ElementFactory.make("capsfilter", "working")
+        self.working.set_property("caps", self._working_caps())
+        # Elements that may change the format, reported in self.conversions
+        self.converters = [self.audioconvert, self.resample]
+
+    def _working_caps(self, rate: int = 0) -> Gst.Caps:
+        format = self.settings.processing.format
+        caps = f"audio/x-raw,format={format},layout=interleaved"
+        if rate:
+            caps += f",rate={rate}"
+        return Gst.Caps.from_string(caps)
+
     def _highpass_filter(self) -> None:
         """Adds audiowsinclimit element"""
-        self.highpass = Gst.ElementFactory.make("audiowsinclimit")
+        self.highpass = Gst.ElementFactory.make(FILTERS["highpass"])
+        self._update_highpass()
+
+        self.pipeline.add(self.highpass)
+
+    def _update_highpass(self) -> None:
         self.highpass.set_property("cutoff", self.settings.highpass.cutoff)
         self.highpass.set_property("length", self.settings.highpass.length)
         self.highpass.set_property("mode", self.settings.highpass.mode)
         self.highpass.set_property("window", self.settings.highpass.window)
 
-        self.pipeline.add(self.highpass)
-
     def _lowpass_filter(self) -> None:
         """Adds audiocheblimit element"""
-        self.lowpass = Gst.ElementFactory.make("audiocheblimit")
+        self.lowpass = Gst.ElementFactory.make(FILTERS["lowpass"])
+        self._update_lowpass()
+
+        self.pipeline.add(self.lowpass)
+
+    def _update_lowpass(self) -> None:
         self.lowpass.set_property("cutoff", self.settings.lowpass.cutoff)
         self.lowpass.set_property("mode", self.settings.lowpass.mode)
         self.lowpass.set_property("poles", self.settings.lowpass.poles)
         self.lowpass.set_property("ripple", self.settings.lowpass.ripple)
         self.lowpass.set_property("type", self.settings.lowpass.type)
 
-        self.pipeline.add(self.lowpass)
-
     def _echo(self) -> None:
         """Adds echo element"""
-        self.echo = Gst.ElementFactory.make("audioecho")
-        self.echo.set_property("delay", self.settings.echo.delay)
-        self.echo.set_property("feedback", self.settings.echo.feedback)
-        self.echo.set_property("intensity", self.settings.echo.intensity)
-        self.echo.set_property("max_delay", self.settings.echo.max_delay)
+        # max_delay sizes the delay buffer, never below delay but always capped
+        echo = self.settings.echo
+        max_delay = min(max(echo.delay, echo.max_delay), echo.max_delay_cap)
+        self.echo = Gst.ElementFactory.make(FILTERS["echo"])
+        # Only settable before playing, later delays must fit into it
+        self.echo.set_property("max_delay", max_delay)
+        self._update_echo()
 
         self.pipeline.add(self.echo)
 
+    def _update_echo(self) -> None:
+        max_delay = self.echo.get_property("max_delay")
+        if self.settings.echo.delay > max_delay:
+            print(f"Echo delay limited to {max_delay / Gst.SECOND:.3f}s")
+        self.echo.set_property("delay", min(self.settings.echo.delay, max_delay))
+        self.echo.set_property("feedback", self.settings.echo.feedback)
+        self.echo.set_property("intensity", self.settings.echo.intensity)
+
     def _equalizer(self) -> None:
         """Adds equalizer element"""
-        self.equalizer = Gst.ElementFactory.make("equalizer-10bands")
-        for i in range(10):
-            self.equalizer.set_property(f"band{i}", self.settings.equalizer.bands[i])
+        self.equalizer = Gst.ElementFactory.make(FILTERS["equalizer"])
+        self._update_equalizer()
 
         self.pipeline.add(self.equalizer)
 
+    def _update_equalizer(self) -> None:
+        for i in range(10):
+            self.equalizer.set_property(f"band{i}", self.settings.equalizer.bands[i])
+
     def _karaoke(self) -> None:
         """Adds karaoke element"""
-        self.karaoke = Gst.ElementFactory.make("audiokaraoke")
+        self.karaoke = Gst.ElementFactory.make(FILTERS["karaoke"])
+        self._update_karaoke()
+
+        self.pipeline.add(self.karaoke)
+
+    def _update_karaoke(self) -> None:
         self.karaoke.set_property("filter-band", self.settings.karaoke.filter_band)
         self.karaoke.set_property("filter-width", self.settings.karaoke.filter_width)
         self.karaoke.set_property("level", self.settings.karaoke.level)
         self.karaoke.set_property("mono-level", self.settings.karaoke.mono_level)
 
-        self.pipeline.add(self.karaoke)
+    def update(self) -> None:
+        """Pushes current settings into existing elements, also while playing
+
+        Enabling or disabling a stage needs a new pipeline.
+        """
+        for name in self.settings.filters:
+            if getattr(self, name):
+                getattr(self, f"_update_{name}")()
+
+    def _queue(self) -> Gst.Element:
+        """Adds queue element"""
+        queue = Gst.ElementFactory.make("queue")
+        queue.set_property("max-size-buffers", self.settings.queue.max_size_buffers)
+        queue.set_property("max-size-bytes", self.settings.queue.max_size_bytes)
+        queue.set_property("max-size-time", self.settings.queue.max_size_time)
+
+        self.pipeline.add(queue)
+        self.queues.append(queue)
+        return queue
+
+    def _filesink(self) -> None:
+        """Adds encoder selected in settings and filesink element"""
+        output = self.settings.output
+        if output.encoder not in ENCODERS:
+            raise SystemExit(f"Error: Unknown encoder {output.encoder}")
+
+        elements = [Gst.ElementFactory.make(name) for name in ENCODERS[output.encoder]]
+        self.encoder = elements[-1]
+        if output.encoder == "flac":
+            self.encoder.set_property("quality", output.flac_quality)
+        elif output.encoder == "vorbis":
+            self.encoder.set_property("quality", output.vorbis_quality)
+        elif output.encoder == "opus":
+            self.encoder.set_property("bitrate", output.opus_bitrate)
+        elif output.encoder == "raw":
+            self.encoder.set_property("caps", Gst.Caps.from_string(FLOAT_CAPS))
+
+        self.filesink = Gst.ElementFactory.make("filesink")
+        self.filesink.set_property("location", self.settings.output_file)
+        elements.append(self.filesink)
+        # Ogg streams need a muxer between encoder and file
+        if output.encoder in ("vorbis", "opus"):
+            elements.insert(-1, Gst.ElementFactory.make("oggmux"))
+
+        for each in elements:
+            self.pipeline.add(each)
+        for first, second in zip(elements, elements[1:]):
+            first.link(second)
+        self.tail = elements[0]
+        self.converters.extend(
+            each for each in elements if each.get_factory().get_name() in CONVERTERS
+        )
+
+        self.encoding = PipelineMetrics()
+        self.encoding.attach("encoder", self.encoder)
+
+    def output_report(self) -> dict:
+        """Returns encoder name, bytes written and time spent encoding (s)"""
+        location = self.settings.output_file
+        report = {
+            "encoder": self.settings.output.encoder,
+            "bytes": 0,
+            "encode_time": 0.0,
+        }
+        if os.path.exists(location):
+            report["bytes"] = os.path.getsize(location)
+        if self.encoding:
+            report["encode_time"] = self.encoding.stages["encoder"]["time"]
+        return report
+
+    def _appsink(self) -> None:
+        """Adds appsink element, used by blocks()"""
+        # Passthrough unless processing in F64LE
+        convert = Gst.ElementFactory.make("audioconvert")
+        self.appsink = Gst.ElementFactory.make("appsink")
+        self.appsink.set_property("caps", Gst.Caps.from_string(FLOAT_CAPS))
+        # Bounded queue, upstream blocks instead of buffering the whole file
+        self.appsink.set_property("max-buffers", self.settings.stream.max_buffers)
+        self.appsink.set_property("drop", False)
+        self.appsink.set_property("sync", False)
+
+        self.pipeline.add(convert)
+        self.pipeline.add(self.appsink)
+        convert.link(self.appsink)
+        self.tail = convert
+        self.converters.append(convert)
+
+    def _monitorsink(self) -> None:
+        """Adds audio sink for listening while processing"""
+        convert = Gst.ElementFactory.make("audioconvert")
+        resample = Gst.ElementFactory.make("audioresample")
+        self.monitor = Gst.ElementFactory.make(self.settings.monitor.sink)
+        if self.settings.monitor.sink == "fakesink":
+            self.monitor.set_property("sync", True)
+        self._configure_monitor(self.monitor)
+        # autoaudiosink only creates the real sink once it starts
+        if isinstance(self.monitor, Gst.Bin):
+            self.monitor.connect(
+                "element-added", lambda bin, element: self._configure_monitor(element)
+            )
+
+        for each in (convert, resample, self.monitor):
+            self.pipeline.add(each)
+        convert.link(resample)
+        resample.link(self.monitor)
+        self.tail = convert
+        self.converters.extend((convert, resample))
+
+        convert.get_static_pad("sink").add_probe(
+            Gst.PadProbeType.BUFFER, self._on_monitor_buffer
+        )
+
+    def _configure_monitor(self, sink: Gst.Element) -> None:
+        """Applies latency target to audio sinks that support it"""
+        if sink.find_property("buffer-time"):
+            sink.set_property("buffer-time", self.settings.monitor.buffer_time)
+        if sink.find_property("latency-time"):
+            sink.set_property("latency-time", self.settings.monitor.latency_time)
+
+    def _on_monitor_buffer(self, pad, info) -> Gst.PadProbeReturn:
+        """Records how long before playback a processed buffer is ready"""
+        clock = self.pipeline.get_clock()
+        event = pad.get_sticky_event(Gst.EventType.SEGMENT, 0)
+        if clock and event:
+            segment = event.parse_segment()
+            running = segment.to_running_time(Gst.Format.TIME, info.get_buffer().pts)
+            now = clock.get_time() - self.pipeline.get_base_time()
+            self.ahead.append(running - now)
+            del self.ahead[:-100]
+        return Gst.PadProbeReturn.OK
+
+    def latency(self) -> dict:
+        """Returns measured end-to-end latency of the monitor output in ns
+
+        A changed setting reaches the filters for the next buffer, which is
+        heard after the data already queued ahead of the sink plus the
+        sink's own buffer.
+        """
+        query = Gst.Query.new_latency()
+        reported = query.parse_latency()[1] if self.pipeline.query(query) else 0
+        ahead = sum(self.ahead) // len(self.ahead) if self.ahead else 0
+        device = self.settings.monitor.buffer_time * 1000
+        return {
+            "reported": reported,
+            "queued": ahead,
+            "device": device,
+            "total": max(ahead, 0) + device,
+        }
 
     def _link(self) -> None:
         """Links enabled elements"""
@@ -137,40 +515,250 @@ class Pipeline:
 
         last = None
         for each in elements:
+            if each and self.settings.queue.enabled:
+                # Queue in front of every stage gives it its own streaming thread
+                queue = self._queue()
+                (last or self.working).link(queue)
+                last = queue
             # Link elements together
             if each and last:
                 last.link(each)
                 last = each
             elif each:
                 # Link first element
-                self.audioconvert.link(each)
+                self.working.link(each)
                 last = each
         if last:
-            # Link last element to wavenc
-            last.link(self.wavenc)
+            # Link last element to the sink side
+            last.link(self.tail)
+            if self.settings.analysis.enabled:
+                self._analyzers(last)
+        elif self.bypass:
+            self.working.link(self.tail)
         else:
             # Handle no linked elements
             raise SystemExit("Error: No elements were created")
 
+    def _analyzers(self, last: Gst.Element) -> None:
+        """Measures audio entering and leaving the filter chain
+
+        Probes on existing pads instead of a tee with spectrum/level
+        branches, nothing is copied and no extra decode is needed.
+        """
+        bands = self.settings.analysis.bands
+        dtype = "<f8" if self.settings.processing.format == "F64LE" else "<f4"
+        self.before = LevelAnalyzer(bands, dtype)
+        self.after = LevelAnalyzer(bands, dtype)
+        self.before.attach(self.working.get_static_pad("src"))
+        self.after.attach(last.get_static_pad("src"))
+
+    def sidecar_path(self) -> str:
+        """Returns location of the analysis report"""
+        if self.settings.analysis.sidecar:
+            return self.settings.analysis.sidecar
+        return f"{self.settings.output_file}.analysis.json"
+
     def run(self) -> None:
         """Runs the pipeline"""
-        self.pipeline.set_state(Gst.State.PLAYING)
+        self.running = True
+        self._set_state(Gst.State.PLAYING)
         self.mainloop.run()
 
+    def preroll(self) -> int:
+        """Pauses the pipeline until data is ready, returns duration in ns"""
+        self._set_state(Gst.State.PAUSED)
+        self.pipeline.get_state(Gst.CLOCK_TIME_NONE)
+        ok, duration = self.pipeline.query_duration(Gst.Format.TIME)
+        return duration if ok else 0
+
+    def seek(self, start: int, stop: int = -1) -> None:
+        """Limits processing to start..stop (ns), pipeline must be prerolled"""
+        self.pipeline.seek(
+            1.0,
+            Gst.Format.TIME,
+            Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE,
+            Gst.SeekType.SET,
+            start,
+            Gst.SeekType.SET if stop >= 0 else Gst.SeekType.NONE,
+            stop,
+        )
+        self.pipeline.get_state(Gst.CLOCK_TIME_NONE)
+
+    def start(self) -> None:
+        """Starts the pipeline without blocking, call poll() to follow it"""
+        self.running = True
+        self._set_state(Gst.State.PLAYING)
+
+    def poll(self) -> bool:
+        """Handles pending EOS/error messages, returns True while running"""
+        while self.running:
+            msg = self.bus.pop_filtered(Gst.MessageType.EOS | Gst.MessageType.ERROR)
+            if msg is None:
+                break
+            if msg.type == Gst.MessageType.EOS:
+                self.on_eos(self.bus, msg)
+            else:
+                self.on_error(self.bus, msg)
+        return self.running
+
+    def blocks(self):
+        """Runs the pipeline, yielding output as bytes of interleaved F32LE
+
+        Memory use is bounded no matter how long the input is: appsink keeps
+        at most settings.stream.max_buffers buffers and blocks upstream until
+        they are consumed, the only other large allocation is the echo delay
+        buffer, see memory_bound().
+        """
+        self.running = True
+        self._set_state(Gst.State.PLAYING)
+        try:
+            while self.running:
+                sample = self.appsink.emit("try-pull-sample", Gst.SECOND // 10)
+                if sample:
+                    buffer = sample.get_buffer()
+                    self.block_pts = buffer.pts
+                    self.largest_block = max(self.largest_block, buffer.get_size())
+                    yield buffer.extract_dup(0, buffer.get_size())
+                elif self.appsink.get_property("eos"):
+                    ok, duration = self.pipeline.query_duration(Gst.Format.TIME)
+                    if ok:
+                        self.duration = duration
+                    self.conversions = self._find_conversions()
+                    if self.before:
+                        self._write_sidecar()
+                    break
+                else:
+                    msg = self.bus.pop_filtered(Gst.MessageType.ERROR)
+                    if msg:
+                        self.on_error(self.bus, msg)
+        finally:
+            self.stop()
+
+    def memory_bound(self) -> dict:
+        """Returns sizes of the largest allocations in bytes
+
+        Sample rate, channel count and buffer size are known once data has
+        started flowing.
+        """
+        bound = {"echo_delay_buffer": 0, "stream_queue": 0, "queues": 0}
+        if self.echo:
+            # Worst case of 8 byte (F64) samples
+            max_delay = self.echo.get_property("max_delay")
+            frame = self.channels * 8
+            bound["echo_delay_buffer"] = int(max_delay / Gst.SECOND * self.rate * frame)
+        if self.appsink:
+            bound["stream_queue"] = (
+                self.settings.stream.max_buffers * self.largest_block
+            )
+        # A queue takes one more buffer once it is at max-size-bytes
+        bound["queues"] = len(self.queues) * (
+            self.settings.queue.max_size_bytes + self.largest_block
+        )
+        return bound
+
+    def _find_conversions(self) -> list:
+        """Returns converters whose output caps differ from their input caps
+
+        Negotiated caps are gone once the pipeline stops, so this runs on EOS.
+        Converters with equal caps on both pads run in passthrough and cost
+        nothing.
+        """
+        conversions = []
+        for each in self.converters:
+            sink = each.get_static_pad("sink").get_current_caps()
+            src = each.get_static_pad("src").get_current_caps()
+            if sink and src and not sink.is_equal(src):
+                conversions.append(
+                    {
+                        "element": each.get_name(),
+                        "from": sink.to_string(),
+                        "to": src.to_string(),
+                    }
+                )
+        return conversions
+
+    def progress(self) -> tuple:
+        """Returns (position, duration) in ns, 0 when not known yet"""
+        ok, position = self.pipeline.query_position(Gst.Format.TIME)
+        if not ok:
+            position = 0
+        ok, duration = self.pipeline.query_duration(Gst.Format.TIME)
+        if not ok:
+            duration = 0
+        return position, duration
+
+    def cancel(self) -> None:
+        """Finishes processing early, EOS lets the encoder write a valid file"""
+        self.cancelled = True
+        self.pipeline.send_event(Gst.Event.new_eos())
+
+    def stop(self) -> None:
+        """Stops the pipeline, keeping elements ready for another run"""
+        self.running = False
+        self._set_state(Gst.State.READY)
+        self.mainloop.quit()
+
     def kill(self) -> None:
-        """Stops the pipeline"""
-        self.pipeline.set_state(Gst.State.NULL)
+        """Stops the pipeline and releases all resources"""
+        self.running = False
+        self._set_state(Gst.State.NULL)
         self.mainloop.quit()
 
+    def reset(self, input_file: str, output_file: str) -> None:
+        """Prepares stopped pipeline for the next file without rebuilding it"""
+        # filesrc and filesink only accept new locations in NULL or READY
+        self._set_state(Gst.State.READY)
+        # Drops EOS or error of the previous file still queued on the bus
+        self.bus.set_flushing(True)
+        self.bus.set_flushing(False)
+        self.settings.input_file = input_file
+        self.settings.output_file = output_file
+        self.src.set_property("location", input_file)
+        if self.filesink:
+            self.filesink.set_property("location", output_file)
+
+        self.rate = 0
+        self.channels = 0
+        self.duration = 0
+        self.error = None
+        self.cancelled = False
+        self.largest_block = 0
+        self.conversions = []
+        if self.before:
+            self.before.reset()
+            self.after.reset()
+        if self.metrics:
+            self.metrics.reset()
+        if self.encoding:
+            self.encoding.reset()
+
+    def _write_sidecar(self) -> None:
+        """Writes analysis report, a failure becomes the pipeline error"""
+        try:
+            write_sidecar(self.sidecar_path(), self.before, self.after)
+        except (OSError, ValueError) as e:
+            self.error = e
+            print(f"Error: {e}")
+
     def on_eos(self, bus, msg) -> None:
         """Callback to stop pipeline on EOS"""
         print(f"EOS: Reached end of stream, stopping pipeline")
-        self.kill()
+        try:
+            ok, duration = self.pipeline.query_duration(Gst.Format.TIME)
+            if ok:
+                self.duration = duration
+            self.conversions = self._find_conversions()
+            if self.before:
+                self._write_sidecar()
+        finally:
+            # Main loop never returns without it
+            self.stop()
 
     def on_error(self, bus, msg) -> None:
         """Calback to stop pipeline on error"""
-        print(f"Error: {msg.parse_error()}")
-        self.kill()
+        self.error = msg.parse_error()
+        print(f"Error: {self.error}")
+        self.stop()
 
     def graph_pipeline(self) -> None:
         """Generates pipeline graph"""
@@ -182,35 +770,40 @@ class Pipeline:
             print(e)
 
 
-if __name__ == "__main__":
-
-    settings = pipeline_settings()
-
-    # self.input_file: str = (
-    #     "/home/borys/Documents/_Git/Procesory-Sygnalowe/sample.wav"
-    # )
-    # settings.highpass.enabled = True
-    # settings.highpass.cutoff = 500.0
-
-    # settings.lowpass.enabled = True
-    # settings.lowpass.cutoff = 1000
-    # settings.lowpass.type = 1
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Processes one file with settings from a preset"
+    )
+    parser.add_argument("preset", help="JSON or TOML preset, see save_settings")
+    parser.add_argument("input", nargs="?", help="Input file, overrides the preset")
+    parser.add_argument("output", nargs="?", help="Output file, overrides the preset")
+    parser.add_argument(
+        "-g", "--graph", action="store_true", help="Write graph to /tmp/pipeline.pdf"
+    )
+    args = parser.parse_args(argv)
+
+    # Invalid presets fail here, before any element is created
+    try:
+        settings = load_settings(args.preset)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    if args.input:
+        settings.input_file = args.input
+    if args.output:
+        settings.output_file = args.output
 
-    # settings.echo.enabled = True
-    # settings.echo.delay = 3000000000
-    # settings.echo.feedback = 1
-    # settings.echo.intensity = 1
-    # settings.echo.max_delay = 30000000000
+    pipeline = Pipeline(settings)
+    if args.graph:
+        pipeline.graph_pipeline()
+    pipeline.run()
+    pipeline.kill()
+    bound = pipeline.memory_bound()
+    sizes = [f"{name} {size / 1024 ** 2:.1f} MiB" for name, size in bound.items()]
+    print(f"Memory bound: {', '.join(sizes)}")
+    return 1 if pipeline.error else 0
 
-    # settings.equalizer.enabled = True
-    # settings.equalizer.bands[0] = -24.0
-    # settings.equalizer.bands[1] = -24.0
-    # settings.equalizer.bands[2] = -24.0
-    # settings.equalizer.bands[3] = -24.0
 
-    # settings.karaoke.enabled = True
-    # settings.karaoke.filter_band = 220
+if __name__ == "__main__":
 
-    pipeline = Pipeline(settings)
-    pipeline.graph_pipeline()
-    pipeline.run()
+    sys.exit(main())
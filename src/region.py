@@ -0,0 +1,154 @@
+import argparse
+import copy
+import os
+import sys
+import tempfile
+import time
+from src.settings import pipeline_settings, load_settings
+from src.segments import SECOND, settle_time, write_frames, write_wav_header
+
+
+def render_region(
+    settings: pipeline_settings,
+    start: float,
+    end: float,
+    output_file: str,
+    bypass: bool = False,
+) -> dict:
+    """Renders start..end (s) of settings.input_file as a 32-bit float WAV
+
+    Processing starts settle_time() earlier, so filter state at start
+    matches a full render. With bypass the input is copied unfiltered.
+    Analysis is off, the region must not overwrite the full render's sidecar.
+    """
+    from src.pipeline import Pipeline
+
+    if settings.analysis.enabled:
+        settings = copy.deepcopy(settings)
+        settings.analysis.enabled = False
+    pipeline = Pipeline(settings, stream=True, bypass=bypass)
+    duration = pipeline.preroll()
+    rate, channels = pipeline.rate, pipeline.channels
+    keep_start = int(start * rate)
+    keep_end = int(end * rate)
+    if duration:
+        keep_end = min(keep_end, duration * rate // SECOND)
+    if keep_end <= keep_start:
+        pipeline.kill()
+        raise ValueError(f"Empty region {start}..{end} s")
+    preroll = 0 if bypass else int(settle_time(settings, rate) * rate)
+    render_start = max(keep_start - preroll, 0)
+
+    with open(output_file, "wb") as f:
+        write_wav_header(f, keep_end - keep_start, rate, channels)
+        frames = write_frames(
+            pipeline, render_start * SECOND // rate, keep_start, keep_end, f
+        )
+        if frames != keep_end - keep_start:
+            # Input ended early, header has to match the data
+            f.seek(0)
+            write_wav_header(f, frames, rate, channels)
+    pipeline.kill()
+
+    return {
+        "path": output_file,
+        "frames": frames,
+        "preroll": (keep_start - render_start) / rate,
+        "error": str(pipeline.error) if pipeline.error else None,
+    }
+
+
+def render_ab(
+    settings: pipeline_settings, start: float, end: float, directory: str = None
+) -> tuple:
+    """Renders original and processed region, returns both WAV paths
+
+    Every call writes new files, so a render never overwrites one that is
+    still playing. The caller removes them when done.
+    """
+    settings = copy.deepcopy(settings)
+    paths = []
+    try:
+        for name, bypass in (("original", True), ("processed", False)):
+            handle, path = tempfile.mkstemp(
+                suffix=".wav", prefix=f"region_{name}_", dir=directory
+            )
+            os.close(handle)
+            paths.append(path)
+            result = render_region(settings, start, end, path, bypass)
+            if result["error"]:
+                raise RuntimeError(result["error"])
+    except BaseException:
+        for path in paths:
+            os.remove(path)
+        raise
+    return tuple(paths)
+
+
+class Player:
+    """Plays a file to the default audio device, one at a time"""
+
+    def __init__(self) -> None:
+        self.playbin = None
+
+    def play(self, path: str) -> None:
+        # Initialized on import of src.pipeline
+        from src.pipeline import Gst, PLUGINS, element_available
+
+        self.stop()
+        if not element_available("playbin"):
+            raise SystemExit(
+                f"Error: Missing GStreamer elements: playbin ({PLUGINS['playbin']})"
+            )
+        playbin = Gst.ElementFactory.make("playbin")
+        if playbin is None:
+            raise SystemExit("Error: Could not create playbin")
+        self.playbin = playbin
+        self.playbin.set_property("uri", Gst.filename_to_uri(path))
+        self.playbin.set_state(Gst.State.PLAYING)
+
+    def stop(self) -> None:
+        from src.pipeline import Gst
+
+        if self.playbin:
+            self.playbin.set_state(Gst.State.NULL)
+            self.playbin = None
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Renders original and processed region of a file for A/B listening"
+    )
+    parser.add_argument("settings", help="JSON or TOML preset")
+    parser.add_argument("input", help="Input file")
+    parser.add_argument("start", type=float, help="Region start (s)")
+    parser.add_argument("end", type=float, help="Region end (s)")
+    parser.add_argument(
+        "-o", "--output-dir", default=tempfile.gettempdir(), help="Output directory"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        settings = load_settings(args.settings)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    settings.input_file = args.input
+
+    started = time.perf_counter()
+    try:
+        original, processed = render_ab(
+            settings, args.start, args.end, args.output_dir
+        )
+    except (RuntimeError, ValueError) as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"A: {original}")
+    print(f"B: {processed}")
+    print(f"Done in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
@@ -0,0 +1,231 @@
+import argparse
+import copy
+import math
+import multiprocessing
+import os
+import struct
+import sys
+import tempfile
+import time
+import numpy as np
+from src.settings import pipeline_settings, load_settings
+
+
+SECOND = 1000000000  # ns
+# Chebyshev and equalizer biquads settle well within this time (s)
+IIR_SETTLE = 0.1
+
+
+def settle_time(settings: pipeline_settings, rate: int) -> float:
+    """Returns seconds of input needed before filter state matches a serial run
+
+    The high-pass kernel needs its full length of history, echo its delay
+    line repeated until feedback decays below -80 dB, never more than
+    max_delay_cap.
+    """
+    seconds = IIR_SETTLE
+    if settings.highpass.enabled:
+        seconds += settings.highpass.length / rate
+    if settings.echo.enabled:
+        echo = settings.echo
+        # audioecho delays by at least one frame, 0 is allowed in the GUI
+        delay = max(echo.delay, 1)
+        # Feedback of 1 or more never decays
+        repeats = echo.max_delay_cap // delay
+        if echo.feedback <= 0:
+            repeats = 1
+        elif echo.feedback < 1:
+            repeats = min(math.ceil(math.log(1e-4) / math.log(echo.feedback)), repeats)
+        seconds += max(repeats, 1) * delay / SECOND
+    return seconds
+
+
+def write_wav_header(f, frames: int, rate: int, channels: int) -> None:
+    """Writes header of a 32-bit float WAV file"""
+    size = frames * channels * 4
+    f.write(b"RIFF" + struct.pack("<I", 36 + size) + b"WAVE")
+    f.write(b"fmt " + struct.pack("<IHH", 16, 3, channels))
+    f.write(struct.pack("<IIHH", rate, rate * channels * 4, channels * 4, 32))
+    f.write(b"data" + struct.pack("<I", size))
+
+
+def write_frames(pipeline, render_start: int, keep_start: int, keep_end: int, f) -> int:
+    """Renders from render_start (ns), writes frames keep_start..keep_end to f
+
+    Pipeline must be a prerolled stream pipeline, frames before keep_start
+    only settle filter state. Returns number of frames written.
+    """
+    rate = pipeline.rate
+    # Small margin past the end, extra frames are cut below
+    pipeline.seek(render_start, keep_end * SECOND // rate + SECOND // 10)
+
+    frame = pipeline.channels * 4
+    remaining = (keep_end - keep_start) * frame
+    written = 0
+    skip = None
+    for block in pipeline.blocks():
+        if skip is None:
+            # Pre-roll is measured from the first timestamp, seeks may land early
+            first = round(pipeline.block_pts * rate / SECOND)
+            skip = max(keep_start - first, 0) * frame
+        if skip:
+            dropped = min(skip, len(block))
+            block = block[dropped:]
+            skip -= dropped
+        block = block[:remaining]
+        f.write(block)
+        written += len(block)
+        remaining -= len(block)
+        if not remaining:
+            pipeline.cancel()
+    return written // frame
+
+
+def _render_segment(job: tuple) -> dict:
+    """Renders frames keep_start..keep_end to a raw F32LE file in a worker"""
+    from src.pipeline import Pipeline
+
+    settings, render_start, keep_start, keep_end, path = job
+    try:
+        pipeline = Pipeline(settings, stream=True)
+    except SystemExit as e:
+        # Pool workers never send back BaseException, map would hang
+        return {"path": path, "frames": 0, "error": str(e)}
+    pipeline.preroll()
+    with open(path, "wb") as f:
+        frames = write_frames(pipeline, render_start, keep_start, keep_end, f)
+    pipeline.kill()
+
+    return {
+        "path": path,
+        "frames": frames,
+        "error": str(pipeline.error) if pipeline.error else None,
+        "memory_bound": pipeline.memory_bound(),
+    }
+
+
+def _stitch(
+    results: list, output_file: str, rate: int, channels: int, crossfade: int
+) -> None:
+    """Joins rendered segments, crossfading the overlapping frames"""
+    frames = results[0]["frames"] + sum(
+        each["frames"] - crossfade for each in results[1:]
+    )
+    chunk = rate * 10
+    with open(output_file, "wb") as f:
+        write_wav_header(f, frames, rate, channels)
+
+        tail = None
+        for each in results:
+            data = np.memmap(each["path"], dtype="<f4", mode="r").reshape(-1, channels)
+            if tail is not None:
+                count = min(len(tail), len(data))
+                fade = np.linspace(0.0, 1.0, count, dtype=np.float32)[:, np.newaxis]
+                mixed = tail[:count] * (1 - fade) + data[:count] * fade
+                f.write(mixed.astype("<f4").tobytes())
+                data = data[count:]
+
+            body = data[: max(len(data) - crossfade, 0)]
+            for start in range(0, len(body), chunk):
+                f.write(np.ascontiguousarray(body[start : start + chunk]).tobytes())
+            tail = np.array(data[len(body) :])
+            del data
+
+        f.write(tail.astype("<f4").tobytes())
+
+
+def run_segmented(
+    settings: pipeline_settings, count: int, crossfade: float = 0.01
+) -> list:
+    """Renders settings.input_file as count segments in parallel processes
+
+    Analysis is turned off, every segment would measure only its own part
+    and write the same sidecar.
+    """
+    from src.pipeline import Pipeline
+
+    if settings.analysis.enabled:
+        print("Analysis is not written for segmented renders")
+        settings = copy.deepcopy(settings)
+        settings.analysis.enabled = False
+    probe = Pipeline(settings, stream=True)
+    duration = probe.preroll()
+    rate, channels = probe.rate, probe.channels
+    probe.kill()
+    if not duration:
+        raise SystemExit("Error: Input duration is unknown, cannot split it")
+
+    total = duration * rate // SECOND
+    fade = int(crossfade * rate)
+    preroll = int(settle_time(settings, rate) * rate)
+    bounds = [total * i // count for i in range(count + 1)]
+
+    workdir = tempfile.mkdtemp(prefix="segments_")
+    jobs = []
+    for index in range(count):
+        keep_start = max(bounds[index] - fade, 0) if index else 0
+        render_start = max(keep_start - preroll, 0)
+        jobs.append(
+            (
+                settings,
+                render_start * SECOND // rate,
+                keep_start,
+                bounds[index + 1],
+                os.path.join(workdir, f"{index}.raw"),
+            )
+        )
+
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(count) as pool:
+        results = pool.map(_render_segment, jobs)
+
+    errors = [each["error"] for each in results if each["error"]]
+    if not errors:
+        _stitch(results, settings.output_file, rate, channels, fade)
+    for each in results:
+        if os.path.exists(each["path"]):
+            os.remove(each["path"])
+    os.rmdir(workdir)
+    if errors:
+        raise SystemExit(f"Error: {errors[0]}")
+    return results
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Splits one long file into segments processed in parallel"
+    )
+    parser.add_argument("settings", help="JSON or TOML preset")
+    parser.add_argument("input", help="Input file")
+    parser.add_argument("output", help="Output WAV file")
+    parser.add_argument(
+        "-n", "--segments", type=int, default=os.cpu_count(), help="Parallel segments"
+    )
+    parser.add_argument(
+        "-c", "--crossfade", type=float, default=0.01, help="Crossfade length (s)"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        settings = load_settings(args.settings)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    settings.input_file = args.input
+    settings.output_file = args.output
+
+    start = time.perf_counter()
+    results = run_segmented(settings, max(1, args.segments), args.crossfade)
+    print(f"Done in {time.perf_counter() - start:.2f}s")
+    bound = {
+        name: max(each["memory_bound"][name] for each in results)
+        for name in results[0]["memory_bound"]
+    }
+    sizes = [f"{name} {size / 1024 ** 2:.1f} MiB" for name, size in bound.items()]
+    print(f"Memory bound per segment: {', '.join(sizes)}")
+    return 0
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
@@ -1,8 +1,19 @@
 import os
-from dataclasses import dataclass, field
+import json
+from dataclasses import dataclass, field, fields, asdict
 
 
 class pipeline_settings:
+    filters = ("highpass", "lowpass", "echo", "equalizer", "karaoke")
+    sections = filters + (
+        "processing",
+        "output",
+        "stream",
+        "queue",
+        "monitor",
+        "analysis",
+    )
+
     def __init__(self) -> None:
 
         self.input_file: str = ""
@@ -14,6 +25,13 @@ class pipeline_settings:
         self.equalizer = equalizer_settings()
         self.karaoke = karaoke_settings()
 
+        self.processing = processing_settings()
+        self.output = output_settings()
+        self.stream = stream_settings()
+        self.queue = queue_settings()
+        self.monitor = monitor_settings()
+        self.analysis = analysis_settings()
+
     def __repr__(self) -> str:
         data = f"""
         Pipeline settings:
@@ -28,10 +46,149 @@ class pipeline_settings:
         Karaoke:
         {self.karaoke}\n
         Equalizer:
-        {self.equalizer}
+        {self.equalizer}\n
+        Processing:
+        {self.processing}\n
+        Output:
+        {self.output}\n
+        Stream:
+        {self.stream}\n
+        Queue:
+        {self.queue}\n
+        Monitor:
+        {self.monitor}\n
+        Analysis:
+        {self.analysis}
         """
         return data
 
+    def to_dict(self) -> dict:
+        """Returns settings as a plain dict"""
+        data = {"input_file": self.input_file, "output_file": self.output_file}
+        for section in self.sections:
+            data[section] = asdict(getattr(self, section))
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "pipeline_settings":
+        """Creates settings from a dict, missing values keep their defaults
+
+        Raises ValueError for unknown settings, wrong types and values out
+        of range, see validate().
+        """
+        settings = cls()
+        for key, value in data.items():
+            if key in ("input_file", "output_file"):
+                if not isinstance(value, str):
+                    raise ValueError(f"{key} must be str")
+                setattr(settings, key, value)
+            elif key in cls.sections:
+                if not isinstance(value, dict):
+                    raise ValueError(f"{key} must be a table of settings")
+                section = getattr(settings, key)
+                types = {each.name: each.type for each in fields(section)}
+                for name, each in value.items():
+                    if name not in types:
+                        raise ValueError(f"Unknown setting: {key}.{name}")
+                    setattr(section, name, _convert(f"{key}.{name}", each, types[name]))
+            else:
+                raise ValueError(f"Unknown setting: {key}")
+        settings.validate()
+        return settings
+
+    def validate(self) -> None:
+        """Raises ValueError listing every value outside the limits in LIMITS"""
+        errors = []
+        for (section, name), limit in LIMITS.items():
+            value = getattr(getattr(self, section), name)
+            values = value if isinstance(value, list) else [value]
+            for each in values:
+                if isinstance(limit, list):
+                    if each not in limit:
+                        errors.append(f"{section}.{name} = {each!r} not one of {limit}")
+                elif not limit[0] <= each <= limit[1]:
+                    low, high = limit
+                    errors.append(f"{section}.{name} = {each} not in {low}..{high}")
+        if len(self.equalizer.bands) != 10:
+            errors.append("equalizer.bands needs 10 values")
+        if self.echo.delay > self.echo.max_delay_cap:
+            errors.append(
+                f"echo.delay = {self.echo.delay} over "
+                f"echo.max_delay_cap = {self.echo.max_delay_cap}"
+            )
+        if errors:
+            raise ValueError("Invalid settings: " + "; ".join(errors))
+
+
+def _convert(name: str, value, kind: type):
+    """Checks value read from a preset against the type of its field"""
+    if kind is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if kind is list:
+        if not isinstance(value, list) or not all(
+            isinstance(each, (int, float)) and not isinstance(each, bool)
+            for each in value
+        ):
+            raise ValueError(f"{name} must be a list of numbers")
+        return [float(each) for each in value]
+    # bool is an int subclass, but true is never a valid length
+    if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+        raise ValueError(f"{name} must be {kind.__name__}")
+    return value
+
+
+def load_settings(path: str) -> pipeline_settings:
+    """Loads and validates settings from a JSON or TOML preset"""
+    if path.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            # Python < 3.11
+            import tomli as tomllib
+
+        with open(path, "rb") as f:
+            return pipeline_settings.from_dict(tomllib.load(f))
+    with open(path) as f:
+        return pipeline_settings.from_dict(json.load(f))
+
+
+def save_settings(settings: pipeline_settings, path: str) -> None:
+    """Saves settings as a JSON or TOML preset, chosen by extension"""
+    settings.validate()
+    data = settings.to_dict()
+    with open(path, "w") as f:
+        if path.endswith(".toml"):
+            f.write(_to_toml(data))
+        else:
+            json.dump(data, f, indent=2)
+
+
+def _toml_value(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, list):
+        return "[" + ", ".join(_toml_value(each) for each in value) + "]"
+    if isinstance(value, str):
+        # JSON string escapes are valid in TOML basic strings
+        return json.dumps(value)
+    return repr(value)
+
+
+def _to_toml(data: dict) -> str:
+    """Formats to_dict() output, sections are tables of plain values"""
+    lines = []
+    tables = []
+    for key, value in data.items():
+        if isinstance(value, dict):
+            tables.append("")
+            tables.append(f"[{key}]")
+            tables.extend(
+                f"{name} = {_toml_value(each)}" for name, each in value.items()
+            )
+        else:
+            lines.append(f"{key} = {_toml_value(value)}")
+    return "\n".join(lines + tables) + "\n"
+
 
 @dataclass(repr=True)
 class highpass_settings:
@@ -43,6 +200,9 @@ class highpass_settings:
     length: int = 101  # 101
     mode: int = 1  # 1 (highpass)
     window: int = 0  # 0
+    # Kernel length from which the NumPy engine switches to FFT convolution,
+    # audiowsinclimit makes this choice internally
+    fft_threshold: int = 64
 
 
 @dataclass(repr=True)
@@ -68,6 +228,8 @@ class echo_settings:
     feedback: float = 0.0  # 0.0 (percent)
     intensity: float = 0.0  # 0.0 (percent)
     max_delay: int = 1000000  # 1 (ns)
+    # audioecho allocates max_delay worth of samples up front
+    max_delay_cap: int = 10000000000  # 10 s (ns)
 
 
 @dataclass(repr=True)
@@ -89,4 +251,116 @@ class karaoke_settings:
     filter_band: float = 220.0  # 220.0
     filter_width: float = 100.0  # 100
     level: float = 1.0  # 1.0 (percent)
-    mono_level = 1.0  # 1.0 (percent)
+    mono_level: float = 1.0  # 1.0 (percent)
+
+
+@dataclass(repr=True)
+class processing_settings:
+    """Sample rate and format the filter chain works in
+    https://gstreamer.freedesktop.org/documentation/audioresample/index.html?gi-language=python"""
+
+    rate: int = 0  # 0 keeps input rate, higher rates are resampled down to it
+    format: str = "F32LE"  # F32LE or F64LE, audiokaraoke needs F32LE
+    resample_quality: int = 4  # 4 (0 fastest - 10 best)
+
+
+@dataclass(repr=True)
+class output_settings:
+    """Output encoder settings
+    https://gstreamer.freedesktop.org/documentation/flac/flacenc.html?gi-language=python
+    https://gstreamer.freedesktop.org/documentation/vorbis/vorbisenc.html?gi-language=python
+    https://gstreamer.freedesktop.org/documentation/opus/opusenc.html?gi-language=python"""
+
+    encoder: str = "wav"  # wav, flac, vorbis, opus or raw (F32LE samples)
+    flac_quality: int = 5  # 5 (0 fastest - 8 smallest)
+    vorbis_quality: float = 0.4  # 0.4 (-0.1 - 1.0)
+    opus_bitrate: int = 128000  # 128000 (bit/s)
+
+    @property
+    def extension(self) -> str:
+        return {
+            "wav": ".wav",
+            "flac": ".flac",
+            "vorbis": ".ogg",
+            "opus": ".opus",
+            "raw": ".raw",
+        }[self.encoder]
+
+
+@dataclass(repr=True)
+class stream_settings:
+    """Streaming output settings, see Pipeline.blocks"""
+
+    max_buffers: int = 8  # buffers queued in appsink before upstream blocks
+
+
+@dataclass(repr=True)
+class queue_settings:
+    """Queues between filter stages, each stage then runs in its own thread
+    https://gstreamer.freedesktop.org/documentation/coreelements/queue.html?gi-language=python"""
+
+    enabled: bool = False
+    max_size_buffers: int = 200  # 200
+    max_size_bytes: int = 10485760  # 10485760 (10 MiB)
+    max_size_time: int = 1000000000  # 1000000000 (ns) -> 1s
+
+
+@dataclass(repr=True)
+class monitor_settings:
+    """Live preview output settings
+    https://gstreamer.freedesktop.org/documentation/audio/gstaudiobasesink.html?gi-language=python"""
+
+    sink: str = "autoaudiosink"  # fakesink for testing without audio device
+    buffer_time: int = 40000  # 40000 (us), latency target of the sink
+    latency_time: int = 10000  # 10000 (us)
+
+
+@dataclass(repr=True)
+class analysis_settings:
+    """Level and spectrum of input and output, measured while processing"""
+
+    enabled: bool = False
+    bands: int = 32  # logarithmic bands from 20 Hz to half the sample rate
+    sidecar: str = ""  # JSON report, empty for output_file + ".analysis.json"
+
+
+# Valid values of settings, (min, max) or a list of choices. Ranges match
+# the limits of the GStreamer properties they are set to.
+LIMITS = {
+    ("highpass", "cutoff"): (0.0, 3.4028234663852886e38),
+    ("highpass", "length"): (3, 256000),
+    ("highpass", "mode"): (0, 1),
+    ("highpass", "window"): (0, 4),
+    ("highpass", "fft_threshold"): (1, 256000),
+    ("lowpass", "cutoff"): (0.0, 3.4028234663852886e38),
+    ("lowpass", "mode"): (0, 1),
+    ("lowpass", "poles"): (2, 32),
+    ("lowpass", "ripple"): (0.0, 200.0),
+    ("lowpass", "type"): (1, 2),
+    ("echo", "delay"): (1, 2 ** 64 - 1),
+    ("echo", "feedback"): (0.0, 1.0),
+    ("echo", "intensity"): (0.0, 1.0),
+    ("echo", "max_delay"): (1, 2 ** 64 - 1),
+    ("echo", "max_delay_cap"): (1, 2 ** 64 - 1),
+    ("equalizer", "bands"): (-24.0, 12.0),
+    ("karaoke", "filter_band"): (0.0, 441.0),
+    ("karaoke", "filter_width"): (0.0, 100.0),
+    ("karaoke", "level"): (0.0, 1.0),
+    ("karaoke", "mono_level"): (0.0, 1.0),
+    ("processing", "rate"): (0, 2 ** 31 - 1),
+    ("processing", "format"): ["F32LE", "F64LE"],
+    ("processing", "resample_quality"): (0, 10),
+    ("output", "encoder"): ["wav", "flac", "vorbis", "opus", "raw"],
+    ("output", "flac_quality"): (0, 8),
+    ("output", "vorbis_quality"): (-0.1, 1.0),
+    ("output", "opus_bitrate"): (4000, 650000),
+    # 0 would let appsink buffer the whole file
+    ("stream", "max_buffers"): (1, 2 ** 32 - 1),
+    # 0 would make a queue unbounded
+    ("queue", "max_size_buffers"): (1, 2 ** 32 - 1),
+    ("queue", "max_size_bytes"): (1, 2 ** 32 - 1),
+    ("queue", "max_size_time"): (1, 2 ** 64 - 1),
+    ("monitor", "buffer_time"): (1, 2 ** 63 - 1),
+    ("monitor", "latency_time"): (1, 2 ** 63 - 1),
+    ("analysis", "bands"): (1, 1024),
+}
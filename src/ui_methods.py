@@ -1,8 +1,18 @@
-from shutil import copyfile
+import copy
+import importlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from PyQt5 import QtCore, QtGui, QtWidgets
 from ui.MainWindow import Ui_ProcesorySygnaowe
-from src.settings import pipeline_settings
-from src.pipeline import Pipeline
+from src.settings import pipeline_settings, load_settings, save_settings
+from src.cache import RenderCache
+from src.files import place_file
+from src.peaks import load_peaks
+from src.region import Player, render_ab
+from src.waveform_view import WaveformView
 
 
 class UiMethods:
@@ -17,24 +27,143 @@ class UiMethods:
         self.parent = main_window
         self.settings = settings
 
+        self.pipeline = None
+        self.started = 0.0
+
+        self.cache = RenderCache()
+        self.render_key = None
+        # Hashing inputs and copying renders into the cache block for
+        # seconds on large files, both run here one at a time
+        self.storage = ThreadPoolExecutor(max_workers=1)
+        self.lookup_job = None  # (settings, Future of find_render)
+        self.store_job = None  # Future of store_render
+        self.lookup_timer = QtCore.QTimer(self.parent)
+        self.lookup_timer.setInterval(50)
+        self.lookup_timer.timeout.connect(self.poll_lookup)
+        # Latest render, moves to the first save location
+        self.rendered = None
+
+        # Listens to the chain live instead of rendering a file
+        self.preview = QtWidgets.QPushButton("Preview")
+        self.preview.setEnabled(False)
+        self.ui.statusbar.addPermanentWidget(self.preview)
+
+        # Progress widgets live in the status bar, hidden while idle
+        self.progress = QtWidgets.QProgressBar()
+        self.progress.setRange(0, 1000)
+        self.progress.setTextVisible(False)
+        self.eta = QtWidgets.QLabel()
+        self.cancel = QtWidgets.QPushButton("Cancel")
+        for widget in (self.progress, self.eta, self.cancel):
+            self.ui.statusbar.addPermanentWidget(widget)
+            widget.hide()
+
+        # Polls the pipeline bus from Qt's event loop instead of blocking it
+        self.timer = QtCore.QTimer(self.parent)
+        self.timer.setInterval(100)
+        self.timer.timeout.connect(self.poll_pipeline)
+
+        # Collapses bursts of widget changes into one update of the pipeline
+        self.debounce = QtCore.QTimer(self.parent)
+        self.debounce.setSingleShot(True)
+        self.debounce.setInterval(50)
+        self.debounce.timeout.connect(self.update_pipeline)
+
+        # Waveform of input and output, peaks are built away from the GUI thread
+        self.waveform = WaveformView()
+        # A/B audition of the region selected in the waveform
+        self.play_original = QtWidgets.QPushButton("A: original")
+        self.play_processed = QtWidgets.QPushButton("B: processed")
+        self.stop_playing = QtWidgets.QPushButton("Stop")
+        buttons = QtWidgets.QHBoxLayout()
+        for widget in (self.play_original, self.play_processed, self.stop_playing):
+            buttons.addWidget(widget)
+        buttons.addStretch()
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(self.waveform)
+        layout.addLayout(buttons)
+        panel = QtWidgets.QWidget()
+        panel.setLayout(layout)
+        dock = QtWidgets.QDockWidget("Waveform", self.parent)
+        dock.setWidget(panel)
+        self.parent.addDockWidget(QtCore.Qt.BottomDockWidgetArea, dock)
+        self.peaks = ThreadPoolExecutor(max_workers=1)
+        self.peak_jobs = {}  # track -> Future of load_peaks
+        self.peaks_timer = QtCore.QTimer(self.parent)
+        self.peaks_timer.setInterval(200)
+        self.peaks_timer.timeout.connect(self.poll_peaks)
+
+        self.player = Player()
+        self.regions = ThreadPoolExecutor(max_workers=1)
+        self.region_job = None  # (key, Future of render_ab)
+        self.region_key = None  # selection and settings of region_files
+        self.region_files = None  # (original, processed)
+        self.audition_processed = False
+        self.region_timer = QtCore.QTimer(self.parent)
+        self.region_timer.setInterval(50)
+        self.region_timer.timeout.connect(self.poll_region)
+
+        # Same preset files as headless runs, see src.pipeline and src.batch
+        presets = self.parent.menuBar().addMenu("Presets")
+        self.load_preset_action = presets.addAction("Load preset...")
+        self.save_preset_action = presets.addAction("Save preset...")
+
+    def warm_up(self) -> None:
+        """Loads GStreamer in the background once the window is shown
+
+        src.pipeline runs Gst.init and the plugin registry scan on import,
+        which would otherwise delay the window. A Run clicked before it
+        finishes waits for the import.
+        """
+        threading.Thread(
+            target=importlib.import_module, args=("src.pipeline",), daemon=True
+        ).start()
+
     def select_input_file(self) -> None:
         """Opens open file dialog and saves its location"""
         file, _ = QtWidgets.QFileDialog.getOpenFileName(
-            self.parent, "Open file", "", "Audio files (*.wav)"
+            self.parent,
+            "Open file",
+            "",
+            "Audio files (*.wav *.flac *.mp3 *.ogg *.opus *.m4a *.aac *.aiff *.wma "
+            "*.mka *.webm *.mp4);;All files (*)",
         )
 
         if file:
             self.settings.input_file = file
             self.ui.FilePath.setText(file)
             self.ui.Run.setEnabled(True)
+            self.preview.setEnabled(True)
+            self.waveform.clear("output")
+            self.show_peaks("input", file)
+
+    def show_peaks(self, track: str, file: str) -> None:
+        """Loads peaks of file in the background, see poll_peaks"""
+        self.peak_jobs[track] = self.peaks.submit(load_peaks, file)
+        self.peaks_timer.start()
+
+    def poll_peaks(self) -> None:
+        """Shows finished peaks in the waveform view"""
+        for track, job in list(self.peak_jobs.items()):
+            if not job.done():
+                continue
+            del self.peak_jobs[track]
+            try:
+                self.waveform.set_peaks(track, job.result())
+            except Exception as e:
+                print(e)
+                self.ui.statusbar.showMessage(f"No waveform for {track}: {e}")
+        if not self.peak_jobs:
+            self.peaks_timer.stop()
 
     def save_path(self, file: str):
         """Checks if user typed extension"""
+        extension = self.settings.output.extension
 
-        if file.endswith(".wav"):
+        if file.endswith(extension):
             return file
         else:
-            return f"{file}.wav"
+            return f"{file}{extension}"
 
     def save_output(self) -> None:
         """Opens save file dialog and saves file to provided location"""
@@ -44,11 +173,23 @@ class UiMethods:
 
         if file:
             try:
-                copyfile(self.settings.output_file, self.save_path(file))
+                path = self.save_path(file)
+                if self.store_job:
+                    # The render may still be copied into the cache
+                    self.store_job.result()
+                cached = self.render_key and self.cache.get(self.render_key)
+                if cached:
+                    strategy = place_file(cached, path)
+                else:
+                    # Temporary render is not needed anymore, move it
+                    move = self.rendered == self.settings.output_file
+                    strategy = place_file(self.rendered, path, move=move)
+                    self.rendered = path
+                print(f"Saved {path} ({strategy})")
                 msg = QtWidgets.QMessageBox()
                 msg.setIcon(QtWidgets.QMessageBox.Information)
                 msg.setText("Success")
-                msg.setInformativeText("Output file saved successfully.")
+                msg.setInformativeText(f"Output file saved successfully ({strategy}).")
                 msg.setWindowTitle("File saved")
                 msg.exec_()
             except Exception as e:
@@ -60,25 +201,108 @@ class UiMethods:
                 msg.setWindowTitle("Error")
                 msg.exec_()
 
+    def load_preset(self) -> None:
+        """Opens preset file dialog and applies the preset to the widgets"""
+        file, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self.parent, "Load preset", "", "Presets (*.toml *.json)"
+        )
+
+        if file:
+            try:
+                preset = load_settings(file)
+            except (OSError, ValueError) as e:
+                print(e)
+                msg = QtWidgets.QMessageBox()
+                msg.setIcon(QtWidgets.QMessageBox.Critical)
+                msg.setText("Error")
+                msg.setInformativeText(f"Invalid preset: {e}")
+                msg.setWindowTitle("Error")
+                msg.exec_()
+                return
+
+            # Files stay the ones selected in the window
+            for section in preset.sections:
+                setattr(self.settings, section, getattr(preset, section))
+            self.show_settings()
+            self.debounce.start()
+
+    def save_preset(self) -> None:
+        """Opens save file dialog and saves current settings as a preset"""
+        file, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self.parent, "Save preset", "", "Presets (*.toml *.json)"
+        )
+
+        if file:
+            if not file.endswith((".toml", ".json")):
+                file = f"{file}.toml"
+            try:
+                save_settings(self.settings, file)
+                self.ui.statusbar.showMessage(f"Preset saved to {file}")
+            except (OSError, ValueError) as e:
+                print(e)
+                msg = QtWidgets.QMessageBox()
+                msg.setIcon(QtWidgets.QMessageBox.Critical)
+                msg.setText("Error")
+                msg.setInformativeText("Error while saving preset.")
+                msg.setWindowTitle("Error")
+                msg.exec_()
+
+    def show_settings(self) -> None:
+        """Sets widgets to current settings without triggering their updates"""
+        ui = self.ui
+        values = (
+            (ui.enable_HighPass.setChecked, self.settings.highpass.enabled),
+            (ui.highpass_cutoff.setValue, self.settings.highpass.cutoff),
+            (ui.highpass_length.setValue, self.settings.highpass.length),
+            (ui.highpass_window.setCurrentIndex, self.settings.highpass.window),
+            (ui.enable_LowPass.setChecked, self.settings.lowpass.enabled),
+            (ui.lowpass_cutoff.setValue, self.settings.lowpass.cutoff),
+            (ui.lowpass_poles.setValue, self.settings.lowpass.poles),
+            (ui.lowpass_ripple.setValue, self.settings.lowpass.ripple),
+            (ui.lowpass_type.setCurrentIndex, self.settings.lowpass.type - 1),
+            (ui.enable_Echo.setChecked, self.settings.echo.enabled),
+            (ui.echo_delay.setValue, self.settings.echo.delay // 1000000),
+            (ui.echo_feedback.setValue, self.settings.echo.feedback * 100),
+            (ui.echo_intensity.setValue, self.settings.echo.intensity * 100),
+            (ui.enable_Karaoke.setChecked, self.settings.karaoke.enabled),
+            (ui.karaoke_filter_band.setValue, self.settings.karaoke.filter_band),
+            (ui.karaoke_filter_width.setValue, self.settings.karaoke.filter_width),
+            (ui.karaoke_level.setValue, self.settings.karaoke.level * 100),
+            (ui.karaoke_mono_level.setValue, self.settings.karaoke.mono_level * 100),
+            (ui.enable_Equalizer.setChecked, self.settings.equalizer.enabled),
+        )
+        for i, band in enumerate(self.settings.equalizer.bands):
+            values += ((getattr(ui, f"verticalSlider_{i}").setValue, int(band)),)
+
+        for setter, value in values:
+            widget = setter.__self__
+            widget.blockSignals(True)
+            setter(value)
+            widget.blockSignals(False)
+
     # HighPass
     def update_highpass_settings(self):
         """Updates highpass settings"""
         self.settings.highpass.enabled = self.ui.enable_HighPass.isChecked()
 
         self.settings.highpass.cutoff = self.ui.highpass_cutoff.value()
-        self.settings.highpass.length = self.ui.highpass_length.value()
+        self.settings.highpass.length = int(self.ui.highpass_length.value())
         self.settings.highpass.window = self.ui.highpass_window.currentIndex()
 
+        self.debounce.start()
+
     # LowPass
     def update_lowpass_settings(self):
         """Updates lowpass settings"""
         self.settings.lowpass.enabled = self.ui.enable_LowPass.isChecked()
 
         self.settings.lowpass.cutoff = self.ui.lowpass_cutoff.value()
-        self.settings.lowpass.poles = self.ui.lowpass_poles.value()
+        self.settings.lowpass.poles = int(self.ui.lowpass_poles.value())
         self.settings.lowpass.ripple = self.ui.lowpass_ripple.value()
         self.settings.lowpass.type = self.ui.lowpass_type.currentIndex() + 1
 
+        self.debounce.start()
+
     # Echo
     def update_echo_settings(self):
         """Updates echo settings"""
@@ -87,9 +311,19 @@ class UiMethods:
         self.settings.echo.delay = (
             self.ui.echo_delay.value() * 1000000
         )  # Gstreamer uses ns so we convert it to ms
+        if self.settings.echo.delay > self.settings.echo.max_delay_cap:
+            # Delay buffer is allocated up front, keep it within the cap
+            self.settings.echo.delay = self.settings.echo.max_delay_cap
+            limit = self.settings.echo.max_delay_cap // 1000000
+            self.ui.statusbar.showMessage(f"Echo delay limited to {limit} ms")
         self.settings.echo.feedback = self.ui.echo_feedback.value() / 100
         self.settings.echo.intensity = self.ui.echo_intensity.value() / 100
-        self.settings.echo.max_delay = self.settings.echo.delay * 10
+        self.settings.echo.max_delay = max(
+            self.settings.echo.delay,
+            min(self.settings.echo.delay * 10, self.settings.echo.max_delay_cap),
+        )
+
+        self.debounce.start()
 
     # Karaoke
     def update_karaoke_settings(self):
@@ -101,6 +335,8 @@ class UiMethods:
         self.settings.karaoke.level = self.ui.karaoke_level.value() / 100
         self.settings.karaoke.mono_level = self.ui.karaoke_mono_level.value() / 100
 
+        self.debounce.start()
+
     # Equalizer
     def update_equalizer_settings(self):
         """Updates equalizer values"""
@@ -117,12 +353,227 @@ class UiMethods:
         self.settings.equalizer.bands[8] = self.ui.verticalSlider_8.value()
         self.settings.equalizer.bands[9] = self.ui.verticalSlider_9.value()
 
+        self.debounce.start()
+
+    def audition(self, processed: bool) -> None:
+        """Plays selected region, rendered again only after a change of settings"""
+        selection = self.waveform.selection
+        if not selection or selection[1] - selection[0] < 0.01:
+            self.ui.statusbar.showMessage("Select a region with the right mouse button")
+            return
+        self.audition_processed = processed
+
+        key = (selection, json.dumps(self.settings.to_dict(), sort_keys=True))
+        if key == self.region_key:
+            self.play_region()
+        elif not self.region_job:
+            settings = copy.deepcopy(self.settings)
+            job = self.regions.submit(render_ab, settings, *selection)
+            self.region_job = (key, job)
+            self.region_timer.start()
+            self.ui.statusbar.showMessage("Rendering region...")
+
+    def poll_region(self) -> None:
+        """Plays region once render_ab finishes"""
+        key, job = self.region_job
+        if not job.done():
+            return
+        self.region_timer.stop()
+        self.region_job = None
+        try:
+            files = job.result()
+        except SystemExit as e:
+            # Missing plugin, keep the window open
+            self.ui.statusbar.showMessage(str(e))
+            return
+        except Exception as e:
+            print(e)
+            self.ui.statusbar.showMessage(f"Error: {e}")
+            return
+        self.remove_region_files()
+        self.region_files = files
+        self.region_key = key
+        self.play_region()
+
+    def remove_region_files(self) -> None:
+        """Stops playback and deletes files of the previous region"""
+        self.player.stop()
+        for path in self.region_files or ():
+            if os.path.exists(path):
+                os.remove(path)
+        self.region_files = None
+        self.region_key = None
+
+    def play_region(self) -> None:
+        original, processed = self.region_files
+        try:
+            if self.audition_processed:
+                self.player.play(processed)
+                self.ui.statusbar.showMessage("Playing B: processed")
+            else:
+                self.player.play(original)
+                self.ui.statusbar.showMessage("Playing A: original")
+        except SystemExit as e:
+            self.ui.statusbar.showMessage(str(e))
+
     def run_pipeline(self):
-        """Runs pipeline"""
+        """Looks render up in the cache, poll_lookup starts the pipeline"""
         # self.print_settings()
-        pipeline = Pipeline(self.settings)
-        pipeline.run()
-        self.ui.SaveFile.setEnabled(True)
+        if self.pipeline or self.lookup_job:
+            return
+
+        settings = copy.deepcopy(self.settings)
+        job = self.storage.submit(self.find_render, settings)
+        self.lookup_job = (settings, job)
+        self.ui.Run.setEnabled(False)
+        self.ui.statusbar.showMessage("Checking cache...")
+        self.lookup_timer.start()
+
+    def find_render(self, settings: pipeline_settings) -> tuple:
+        """Places cached render at the output file, runs on the storage thread
+
+        Returns cache key and whether the render was found. With analysis
+        enabled the cache is skipped, a hit would leave no sidecar.
+        """
+        if settings.analysis.enabled:
+            if os.path.exists(settings.output_file):
+                os.remove(settings.output_file)
+            return None, False
+        key = self.cache.key(settings)
+        cached = self.cache.get(key)
+        if cached:
+            place_file(cached, settings.output_file)
+        elif os.path.exists(settings.output_file):
+            # New file, the old one may be a hard link into the cache
+            os.remove(settings.output_file)
+        return key, cached is not None
+
+    def store_render(self, key: str, file: str) -> None:
+        """Copies finished render into the cache, runs on the storage thread"""
+        try:
+            self.cache.put(key, file)
+        except OSError as e:
+            # Render is still usable without a cache entry
+            print(f"Not cached: {e}")
+
+    def poll_lookup(self) -> None:
+        """Starts rendering once find_render finishes without a cached render"""
+        settings, job = self.lookup_job
+        if not job.done():
+            return
+        self.lookup_timer.stop()
+        self.lookup_job = None
+        self.ui.Run.setEnabled(True)
+        try:
+            self.render_key, cached = job.result()
+        except OSError as e:
+            self.ui.statusbar.showMessage(f"Error: {e}")
+            return
+        if cached:
+            self.rendered = settings.output_file
+            self.ui.statusbar.showMessage("Done (cached)")
+            self.ui.SaveFile.setEnabled(True)
+            self.show_peaks("output", self.rendered)
+            return
+
+        from src.pipeline import Pipeline
+
+        try:
+            pipeline = Pipeline(settings)
+        except SystemExit as e:
+            # Missing plugin or no enabled filter, keep the window open
+            self.ui.statusbar.showMessage(str(e))
+            return
+        self.start_pipeline(pipeline)
+
+    def preview_pipeline(self):
+        """Starts pipeline playing to the audio device"""
+        if not self.pipeline and not self.lookup_job:
+            from src.pipeline import Pipeline
+
+            try:
+                pipeline = Pipeline(self.settings, monitor=True)
+            except SystemExit as e:
+                self.ui.statusbar.showMessage(str(e))
+                return
+            self.start_pipeline(pipeline)
+
+    def start_pipeline(self, pipeline: "Pipeline"):
+        """Starts given pipeline and shows progress widgets"""
+        self.pipeline = pipeline
+        self.pipeline.start()
+        self.started = time.monotonic()
+
+        self.ui.Run.setEnabled(False)
+        self.preview.setEnabled(False)
+        self.ui.SaveFile.setEnabled(False)
+        self.progress.setValue(0)
+        self.eta.setText("")
+        self.cancel.setEnabled(True)
+        for widget in (self.progress, self.eta, self.cancel):
+            widget.show()
+        self.ui.statusbar.showMessage("Processing...")
+        self.timer.start()
+
+    def poll_pipeline(self):
+        """Updates progress and ETA, cleans up when pipeline finishes"""
+        if self.pipeline.poll():
+            position, duration = self.pipeline.progress()
+            if self.pipeline.monitor:
+                latency = self.pipeline.latency()["total"] / 1e6
+                self.eta.setText(f"Latency {latency:.0f} ms")
+                if duration > 0:
+                    self.progress.setValue(int(min(position / duration, 1.0) * 1000))
+            elif duration > 0 and position > 0:
+                done = min(position / duration, 1.0)
+                elapsed = time.monotonic() - self.started
+                remaining = elapsed * (1 - done) / done
+                self.progress.setValue(int(done * 1000))
+                minutes, seconds = divmod(int(remaining), 60)
+                self.eta.setText(f"ETA {minutes}:{seconds:02d}")
+            return
+
+        self.timer.stop()
+        pipeline, self.pipeline = self.pipeline, None
+        pipeline.kill()
+
+        for widget in (self.progress, self.eta, self.cancel):
+            widget.hide()
+        self.ui.Run.setEnabled(True)
+        self.preview.setEnabled(True)
+
+        if pipeline.error:
+            self.ui.statusbar.showMessage(f"Error: {pipeline.error}")
+        elif pipeline.monitor:
+            self.ui.statusbar.showMessage("Preview stopped")
+        elif pipeline.cancelled:
+            self.ui.statusbar.showMessage("Cancelled")
+        else:
+            elapsed = time.monotonic() - self.started
+            report = pipeline.output_report()
+            self.ui.statusbar.showMessage(
+                f"Done in {elapsed:.1f}s, {report['bytes'] / 1024 ** 2:.1f} MiB "
+                f"{report['encoder']}, {report['encode_time']:.1f}s encoding"
+            )
+            self.ui.SaveFile.setEnabled(True)
+            self.rendered = pipeline.settings.output_file
+            if self.render_key:
+                self.store_job = self.storage.submit(
+                    self.store_render, self.render_key, self.rendered
+                )
+            self.show_peaks("output", self.rendered)
+
+    def update_pipeline(self):
+        """Applies changed settings to a running preview"""
+        # Renders keep the settings they were started with
+        if self.pipeline and self.pipeline.monitor:
+            self.pipeline.update()
+
+    def cancel_pipeline(self):
+        """Stops running pipeline"""
+        if self.pipeline:
+            self.cancel.setEnabled(False)
+            self.pipeline.cancel()
 
     def print_settings(self):
         """Prints settings class values"""
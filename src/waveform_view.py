@@ -0,0 +1,159 @@
+import numpy as np
+from PyQt5 import QtCore, QtGui, QtWidgets
+from src.peaks import PeakPyramid
+
+
+class WaveformView(QtWidgets.QWidget):
+    """Waveform and spectrogram of the input and the processed output
+
+    Both tracks share one time axis. Mouse wheel zooms around the cursor,
+    dragging pans, dragging with the right button selects a region. Drawing
+    reads about one peak value per pixel from the pyramid, so long files
+    zoom as fast as short ones.
+    """
+
+    TRACKS = ("input", "output")
+
+    def __init__(self, parent: QtWidgets.QWidget = None) -> None:
+        super().__init__(parent)
+        self.peaks = {track: None for track in self.TRACKS}
+        self.start = 0.0  # s, left edge of the view
+        self.span = 0.0  # s, visible length, 0 until a file is loaded
+        self._dragged = None  # (x, start) where dragging began
+        self.selection = None  # (start, end) s, region for A/B audition
+        self._selecting = None  # s, where the selection began
+        self.setMinimumHeight(160)
+
+    def set_peaks(self, track: str, peaks: PeakPyramid) -> None:
+        """Shows peaks on track, a new input also resets the view"""
+        self.peaks[track] = peaks
+        if track == "input":
+            self.start = 0.0
+            self.span = self.duration()
+            self.selection = None
+        self.update()
+
+    def clear(self, track: str) -> None:
+        self.peaks[track] = None
+        self.update()
+
+    def duration(self) -> float:
+        """Returns length of the longest track in s"""
+        lengths = [peaks.frames / peaks.rate for peaks in self.peaks.values() if peaks]
+        return max(lengths, default=0.0)
+
+    def _clamp(self) -> None:
+        latest = max(self.duration() - self.span, 0.0)
+        self.start = min(max(self.start, 0.0), latest)
+
+    def wheelEvent(self, event: QtGui.QWheelEvent) -> None:
+        duration = self.duration()
+        if not duration or not self.span:
+            return
+        factor = 0.8 if event.angleDelta().y() > 0 else 1.25
+        span = min(max(self.span * factor, 0.01), duration)
+        # Time under the cursor stays in place
+        anchor = self.start + self.span * event.pos().x() / max(self.width(), 1)
+        self.start = anchor - (anchor - self.start) * span / self.span
+        self.span = span
+        self._clamp()
+        self.update()
+
+    def _time_at(self, x: int) -> float:
+        time = self.start + self.span * x / max(self.width(), 1)
+        return min(max(time, 0.0), self.duration())
+
+    def mousePressEvent(self, event: QtGui.QMouseEvent) -> None:
+        if event.button() == QtCore.Qt.RightButton:
+            self._selecting = self._time_at(event.pos().x())
+            self.selection = None
+            self.update()
+        else:
+            self._dragged = (event.pos().x(), self.start)
+
+    def mouseMoveEvent(self, event: QtGui.QMouseEvent) -> None:
+        if self._selecting is not None:
+            time = self._time_at(event.pos().x())
+            self.selection = (min(self._selecting, time), max(self._selecting, time))
+            self.update()
+        elif self._dragged and self.span:
+            x, start = self._dragged
+            moved = (event.pos().x() - x) / max(self.width(), 1)
+            self.start = start - moved * self.span
+            self._clamp()
+            self.update()
+
+    def mouseReleaseEvent(self, event: QtGui.QMouseEvent) -> None:
+        self._dragged = None
+        self._selecting = None
+
+    def paintEvent(self, event: QtGui.QPaintEvent) -> None:
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), self.palette().base())
+        height = self.height() // len(self.TRACKS)
+        for i, track in enumerate(self.TRACKS):
+            rect = QtCore.QRect(0, i * height, self.width(), height)
+            self._paint_track(painter, rect, track)
+
+        if self.selection and self.span:
+            start, end = self.selection
+            left = int((start - self.start) / self.span * self.width())
+            right = int((end - self.start) / self.span * self.width())
+            color = QtGui.QColor(self.palette().highlight().color())
+            color.setAlpha(80)
+            painter.fillRect(left, 0, max(right - left, 1), self.height(), color)
+        painter.end()
+
+    def _paint_track(
+        self, painter: QtGui.QPainter, rect: QtCore.QRect, track: str
+    ) -> None:
+        """Draws waveform in the upper and spectrogram in the lower half of rect"""
+        peaks = self.peaks[track]
+        painter.setPen(self.palette().text().color())
+        if not peaks or not self.span:
+            painter.drawText(rect.adjusted(4, 2, 0, 0), f"{track}: -")
+            return
+
+        start = int(self.start * peaks.rate)
+        end = int((self.start + self.span) * peaks.rate)
+        # Shorter track only fills part of the width
+        shown = (min(end, peaks.frames) - start) / (end - start)
+        width = int(rect.width() * shown)
+        if width <= 0:
+            painter.drawText(rect.adjusted(4, 2, 0, 0), track)
+            return
+        wave = QtCore.QRect(rect.x(), rect.y(), width, rect.height() // 2)
+        spectrum = QtCore.QRect(
+            rect.x(), wave.bottom() + 1, width, rect.height() - wave.height()
+        )
+
+        columns = peaks.spectrum(start, end)
+        if len(columns):
+            # Low frequencies at the bottom
+            data = np.ascontiguousarray(columns.T[::-1])
+            # QImage does not copy, pixels must outlive drawImage
+            pixels = data.tobytes()
+            image = QtGui.QImage(
+                pixels,
+                data.shape[1],
+                data.shape[0],
+                data.shape[1],
+                QtGui.QImage.Format_Grayscale8,
+            )
+            painter.drawImage(spectrum, image)
+
+        values = peaks.range(start, end, width)
+        if len(values):
+            middle = wave.center().y()
+            half = wave.height() / 2
+            step = width / len(values)
+            lines = []
+            for i, (low, high) in enumerate(values):
+                x = wave.x() + i * step
+                top, bottom = middle - high * half, middle - low * half
+                lines.append(QtCore.QLineF(x, top, x, bottom))
+            painter.setPen(self.palette().highlight().color())
+            painter.drawLines(lines)
+
+        painter.setPen(self.palette().text().color())
+        painter.drawText(rect.adjusted(4, 2, 0, 0), track)